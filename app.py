@@ -9,14 +9,24 @@ import tempfile
 import base64
 import subprocess
 import sys
-from moviepy.editor import VideoFileClip
 import re
+import html as html_lib
 import difflib
 
 from dotenv import load_dotenv
 import streamlit as st
 import openai
 
+import session_store
+import media_files
+from session_store import SegmentTable, TranscriptLine
+from translation_memory import TranslationMemory
+from jmdict_index import DictionaryIndex
+import lesson_package
+from lesson_package import LessonPackage, write_lesson
+from pipeline import StreamingPipeline
+from janome.tokenizer import Tokenizer
+
 # 加载 .env 文件中的环境变量（如 OPENAI_API_KEY）
 load_dotenv()
 
@@ -32,6 +42,43 @@ if 'tmp_path' not in st.session_state:
     st.session_state.tmp_path = None
 if 'show_manual' not in st.session_state:
     st.session_state.show_manual = True
+# 上传的音视频只在点击「开始生成」后才成为当前播放的音视频（tmp_path），
+# 避免与导入的课程包互相覆盖
+if 'upload_key' not in st.session_state:
+    st.session_state.upload_key = None
+if 'upload_path' not in st.session_state:
+    st.session_state.upload_path = None
+# 点击生成后置为 True，由主页面运行流式处理流水线
+if 'processing' not in st.session_state:
+    st.session_state.processing = False
+# 合并后的句子列表，以及按界面语言缓存的字幕行（避免每次交互都重新调用大模型）
+if 'merged_sentences' not in st.session_state:
+    st.session_state.merged_sentences = None
+if 'transcripts' not in st.session_state:
+    st.session_state.transcripts = None
+# 单句分析缓存 {(界面语言, 句子): (词汇表, 分析)}
+if 'analyses' not in st.session_state:
+    st.session_state.analyses = None
+# 已导入的课程包
+if 'lesson_key' not in st.session_state:
+    st.session_state.lesson_key = None
+if 'lesson_path' not in st.session_state:
+    st.session_state.lesson_path = None
+# 每次运行都刷新会话目录的访问时间，仍在使用的会话文件不会被清理
+session_store.session_dir(st.session_state)
+# 页面长时间未操作时会话目录可能已过期被清理，丢弃指向已删除文件的引用
+session_store.discard_missing(st.session_state)
+if st.session_state.upload_path and not os.path.exists(st.session_state.upload_path):
+    st.session_state.upload_path = None
+    st.session_state.upload_key = None
+if st.session_state.tmp_path and not os.path.exists(st.session_state.tmp_path):
+    st.session_state.tmp_path = None
+if st.session_state.lesson_path and not os.path.exists(st.session_state.lesson_path):
+    # 课程包中尚未读取的数据段已无法恢复，整体丢弃导入的课程
+    for key in ("segments", "merged_sentences", "transcripts", "analyses"):
+        session_store.store(st.session_state, key, None)
+    st.session_state.lesson_path = None
+    st.session_state.lesson_key = None
 
 # ========== API Key 检查与输入 ==========
 def check_api_key():
@@ -52,6 +99,34 @@ def check_api_key():
         return False
     return True
 
+# ========== 会话文件 ==========
+# 上传的音视频、课程包等临时文件都写入当前会话的目录，被替换后立即删除，会话结束后按时长整体清理
+def set_media(path):
+    """切换当前播放的音视频，旧文件不再被引用时删除"""
+    old = st.session_state.tmp_path
+    st.session_state.tmp_path = path
+    if old not in (path, st.session_state.upload_path):
+        session_store.remove_file(old)
+
+def set_lesson(path):
+    """切换当前导入的课程包，删除旧的课程包临时文件"""
+    old = st.session_state.lesson_path
+    st.session_state.lesson_path = path
+    if old != path:
+        session_store.remove_file(old)
+
+def load_lesson_data(key):
+    """
+    读取会话中的 segments / merged_sentences / analyses。
+    导入课程包时这些数据段不会立即解压，首次用到时才从课程包中读取并保存到会话中。
+    """
+    value = session_store.load(st.session_state, key)
+    if value is None and st.session_state.lesson_path:
+        with LessonPackage(st.session_state.lesson_path) as lesson:
+            value = getattr(lesson, key)()
+        session_store.store(st.session_state, key, value)
+    return value
+
 # ========== 多语言界面文本映射 ==========
 LANGUAGE_MAPPINGS = {
     "中文": {
@@ -72,6 +147,17 @@ LANGUAGE_MAPPINGS = {
         "api_key_warning": "请先输入您的 OpenAI API Key",
         "api_key_input": "OpenAI API Key",
         "api_key_success": "API Key 已设置！",
+        "memory_stats": "📊 会话内存占用",
+        "memory_total": "合计",
+        "tm_stats": "翻译记忆命中率",
+        "dict_lang": "zh",
+        "lesson_import": "📦 导入课程包",
+        "lesson_export": "📦 导出课程包",
+        "lesson_include_media": "包含音视频",
+        "lesson_download": "⬇ 下载课程包",
+        "lesson_import_error": "导入课程包时出错",
+        "vocab_title": "重点词汇",
+        "vocab_header": "| 词汇 | 假名读音 | 词性 | 中文意思 |\n|------|----------|------|----------|",
         "manual": """
     ### 📖 使用手册
 
@@ -115,6 +201,17 @@ LANGUAGE_MAPPINGS = {
         "api_key_warning": "Please enter your OpenAI API Key first",
         "api_key_input": "OpenAI API Key",
         "api_key_success": "API Key has been set!",
+        "memory_stats": "📊 Session Memory",
+        "memory_total": "Total",
+        "tm_stats": "Translation memory hit rate",
+        "dict_lang": "en",
+        "lesson_import": "📦 Import Lesson Package",
+        "lesson_export": "📦 Export Lesson Package",
+        "lesson_include_media": "Include audio/video",
+        "lesson_download": "⬇ Download Lesson Package",
+        "lesson_import_error": "Failed to import lesson package",
+        "vocab_title": "Vocabulary",
+        "vocab_header": "| Vocabulary | Furigana | Part of Speech | English Meaning |\n|------------|----------|----------------|-----------------|",
         "manual": """
     ### 📖 User Manual
 
@@ -158,6 +255,17 @@ LANGUAGE_MAPPINGS = {
         "api_key_warning": "OpenAI API Key를 먼저 입력해주세요",
         "api_key_input": "OpenAI API Key",
         "api_key_success": "API Key가 설정되었습니다!",
+        "memory_stats": "📊 세션 메모리 사용량",
+        "memory_total": "합계",
+        "tm_stats": "번역 메모리 적중률",
+        "dict_lang": "ko",
+        "lesson_import": "📦 레슨 패키지 가져오기",
+        "lesson_export": "📦 레슨 패키지 내보내기",
+        "lesson_include_media": "오디오/비디오 포함",
+        "lesson_download": "⬇ 레슨 패키지 다운로드",
+        "lesson_import_error": "레슨 패키지를 가져오는 중 오류 발생",
+        "vocab_title": "중요 어휘",
+        "vocab_header": "| 어휘 | 후리가나 | 품사 | 한국어 의미 |\n|------|----------|------|------------|",
         "manual": """
     ### 📖 사용 설명서
 
@@ -227,45 +335,51 @@ with st.sidebar:
     # 文件上传控件，支持多种音视频格式
     uploaded = st.file_uploader(current_lang["upload_text"], type=['mp4', 'mp3', 'wav', 'mov'], disabled=not has_api_key)
     if uploaded and has_api_key:
-        # 保存上传的临时文件
-        suffix = os.path.splitext(uploaded.name)[1]
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(uploaded.read())
-            st.session_state.tmp_path = tmp.name
-        # 生成按钮，点击后开始转写
+        # 保存上传的临时文件（同一文件只写一次，避免每次交互都复制一份到内存和磁盘）
+        upload_key = (uploaded.name, uploaded.size)
+        if st.session_state.upload_key != upload_key:
+            suffix = os.path.splitext(uploaded.name)[1]
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=session_store.session_dir(st.session_state)) as tmp:
+                tmp.write(uploaded.getbuffer())
+            # 旧的上传文件若未在播放则删除
+            if st.session_state.upload_path != st.session_state.tmp_path:
+                session_store.remove_file(st.session_state.upload_path)
+            st.session_state.upload_path = tmp.name
+            st.session_state.upload_key = upload_key
+        # 生成按钮，点击后在主页面边处理边显示字幕
         if st.button(current_lang["start_button"]):
-            with st.spinner(current_lang["transcribing"]):
-                input_file = st.session_state.tmp_path
-                # 若为视频，先提取音频
-                if input_file.lower().endswith(('.mp4', '.mov')):
-                    try:
-                        video = VideoFileClip(input_file)
-                        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_audio:
-                            temp_audio_path = temp_audio.name
-                        video.audio.write_audiofile(temp_audio_path, codec='libmp3lame', fps=44100, nbytes=4, bitrate='192k')
-                        video.close()
-                        input_file = temp_audio_path
-                    except Exception as e:
-                        st.error(f"处理文件时出错: {str(e)}")
-                        st.stop()
-                # Whisper 语音转写
-                try:
-                    resp = openai.Audio.transcribe(
-                        file=open(input_file, "rb"),
-                        model="whisper-1",
-                        response_format="verbose_json"
-                    )
-                    st.session_state.segments = resp.get("segments", [])
-                    st.session_state.show_manual = False
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"转写过程中出错: {str(e)}")
-                finally:
-                    if input_file != st.session_state.tmp_path:
-                        try:
-                            os.unlink(input_file)
-                        except:
-                            pass
+            session_store.store(st.session_state, "segments", None)
+            session_store.store(st.session_state, "merged_sentences", None)
+            session_store.store(st.session_state, "transcripts", None)
+            session_store.store(st.session_state, "analyses", None)
+            set_lesson(None)
+            set_media(st.session_state.upload_path)
+            st.session_state.show_manual = False
+            st.session_state.processing = True
+
+    # 导入课程包：直接载入已处理好的结果，跳过转写、分句、翻译等全部步骤
+    lesson_file = st.file_uploader(current_lang["lesson_import"], type=["nhlesson"], disabled=not has_api_key)
+    if lesson_file and has_api_key:
+        lesson_key = (lesson_file.name, lesson_file.size)
+        if st.session_state.lesson_key != lesson_key:
+            st.session_state.lesson_key = lesson_key
+            with tempfile.NamedTemporaryFile(delete=False, suffix=lesson_package.FILE_SUFFIX, dir=session_store.session_dir(st.session_state)) as tmp:
+                tmp.write(lesson_file.getbuffer())
+            try:
+                # 只解压当前界面语言的字幕，读取后立即关闭；音视频播放时直接从课程包中读取，
+                # 分段、合并后的句子、单句分析和其他语言的字幕在首次用到时再解压
+                with LessonPackage(tmp.name) as lesson:
+                    current_transcript = lesson.transcript(selected_language)
+                set_media(None)
+                session_store.store(st.session_state, "segments", None)
+                session_store.store(st.session_state, "merged_sentences", None)
+                session_store.store(st.session_state, "transcripts", {selected_language: current_transcript} if current_transcript else None)
+                session_store.store(st.session_state, "analyses", None)
+                set_lesson(tmp.name)
+                st.session_state.show_manual = False
+            except Exception as e:
+                session_store.remove_file(tmp.name)
+                st.error(f"{current_lang['lesson_import_error']}: {str(e)}")
 
 # ========== 主页面内容渲染 ==========
 # 显示手册
@@ -284,57 +398,81 @@ def fmt(ts: float) -> str:
     ms = int((ts - int(ts)) * 1000)
     return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
 
-# ========== Whisper转写后主流程 ==========
-if st.session_state.segments:
-    # 单句朗读模块标题
-    st.markdown(f'<h2 class="module-title">{current_lang["reading_module"]}</h2>', unsafe_allow_html=True)
-    # 取 Whisper 原始分句文本
-    raw_sentences = [seg["text"].strip() for seg in st.session_state.segments]
-    # 构造大模型合并分句的提示词
-    merge_prompt = (
-        "是自动语音识别分割的日语句子列表，部分句子被错误拆分。"
-        "请你根据语义和语法，将应该合并的句子合并，输出合并后的完整日语句子列表（每句一行）：\n"
-        + "\n".join(f"{i+1}. {s}" for i, s in enumerate(raw_sentences))
-    )
-    try:
-        # 调用大模型智能合并分句
-        merge_response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "你是日语母语者，擅长根据语义和语法判断句子边界。"},
-                {"role": "user", "content": merge_prompt}
-            ]
-        )
-        # 去除编号，只保留内容
-        merged_sentences = [re.sub(r'^[0-9]+[.、]\s*', '', line.strip()) for line in merge_response.choices[0].message.content.splitlines() if line.strip()]
-        # 用 Whisper 的第一句和大模型第一句做相似度判断，防止大模型输出提示语
-        first_raw = raw_sentences[0]
-        if merged_sentences:
-            first_merged = merged_sentences[0]
-            similarity = difflib.SequenceMatcher(None, first_raw, first_merged).ratio()
-            if similarity < 0.2:
-                merged_sentences = merged_sentences[1:]
-    except Exception as e:
-        st.error(f"智能合并分句时出错: {str(e)}，将使用原始分句。")
-        merged_sentences = raw_sentences
+# ========== 字幕播放器脚本 ==========
+@st.cache_resource
+def load_player_script():
+    """读取字幕播放器脚本 player.js（cue 查找、高亮切换、单句循环）"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "player.js"), encoding="utf-8") as f:
+        return f.read()
 
-    # 生成 WebVTT 字幕和全文分析数据
-    vtt = "WEBVTT\n\n"
-    transcript_data = []
-    for i, ja in enumerate(merged_sentences, start=1):
-        # 计算每句的起止时间戳
-        start_ts = fmt(st.session_state.segments[0]["start"]) if i == 1 else fmt(st.session_state.segments[i-1]["end"])
-        end_ts = fmt(st.session_state.segments[i]["end"]) if i < len(st.session_state.segments) else fmt(st.session_state.segments[-1]["end"])
-        # 翻译日文到中文
-        chat = openai.ChatCompletion.create(
+# ========== 音视频地址 ==========
+# 浏览器按扩展名对应的类型播放（.mov 通常为 H.264 编码，按 mp4 处理）
+MEDIA_MIMETYPES = {".mp4": "video/mp4", ".mov": "video/mp4", ".mp3": "audio/mpeg", ".wav": "audio/wav"}
+
+def media_mimetype(suffix):
+    return MEDIA_MIMETYPES.get((suffix or "").lower(), "video/mp4")
+
+def media_url(path, mimetype, offset=0, length=None):
+    """
+    通过 Streamlit 的媒体文件服务提供音视频（文件或文件中的一段），返回播放地址。
+    页面中只引用 URL，浏览器按 Range 分段请求，不再把整个文件 Base64 编码后内嵌到 HTML 中；
+    文件直接从磁盘读取（见 media_files），不会读入内存。
+    """
+    url = media_files.media_url(path, mimetype, "nihonggo.player.media", offset, length)
+    # 组件 iframe 与主页面同源，使用相对地址以兼容 baseUrlPath
+    return url.lstrip("/")
+
+# ========== 翻译与假名标注 ==========
+@st.cache_resource
+def get_translation_memory():
+    """进程内所有会话共享的翻译记忆"""
+    return TranslationMemory()
+
+def translate_sentence(ja, language, tm):
+    """
+    翻译一句日文并生成带假名的 HTML，返回 (译文, 带假名的日文)。
+    先查询翻译记忆：完全相同的句子直接复用；相似句子把旧译文作为参考，一次调用同时生成译文和假名。
+    流水线的翻译线程中没有 Streamlit 上下文，因此翻译记忆由调用方传入。
+    """
+    lang = LANGUAGE_MAPPINGS[language]
+    match = tm.lookup(language, ja)
+    if match and match.kind == "exact":
+        return match.translation, match.ruby
+    # 同一句在其他语言下已有完整标注的假名时直接复用，参考回复只请求译文，不覆盖已有的假名
+    known_ruby = tm.ruby(ja)
+    if match and match.ruby:
+        if known_ruby is None:
+            output_format = "输出两行：第一行为新句子的译文；第二行为新句子使用HTML的ruby标签、只对汉字标注假名的日文。"
+        else:
+            output_format = "只输出一行新句子的译文。"
+        hint_chat = openai.ChatCompletion.create(
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": f"{current_lang['translation_system']} 注意：这是一个日语学习系统，请确保翻译的准确性和流畅性。如果遇到不完整的句子片段，请根据上下文理解完整意思后再翻译。翻译时要注意保持日语的语言特点和表达方式。"},
-                {"role": "user", "content": ja}
+                {"role": "system", "content": f"{lang['translation_system']} 下面给出一个相似句子的原文、参考译文和假名标注，请参考它们处理新句子。{output_format}不要输出其他内容。"},
+                {"role": "user", "content": f"参考原文：{match.ja}\n参考译文：{match.translation}\n参考假名：{match.ruby}\n\n新句子：{ja}"}
             ]
         )
-        zh = chat.choices[0].message.content.strip()
-        # 获取带假名的日文
+        lines = [line.strip() for line in hint_chat.choices[0].message.content.splitlines() if line.strip()]
+        if len(lines) == (2 if known_ruby is None else 1):
+            zh, ja_with_furigana = lines[0], lines[1] if known_ruby is None else known_ruby
+            tm.record("fuzzy")
+            tm.add(language, ja, zh, ja_with_furigana)
+            return zh, ja_with_furigana
+    if match:
+        # 相似句子没有可用的参考（缺少假名标注或参考回复格式不对），退回完整翻译
+        tm.record("fuzzy_fallback")
+    # 翻译日文到目标语言
+    chat = openai.ChatCompletion.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": f"{lang['translation_system']} 注意：这是一个日语学习系统，请确保翻译的准确性和流畅性。如果遇到不完整的句子片段，请根据上下文理解完整意思后再翻译。翻译时要注意保持日语的语言特点和表达方式。"},
+            {"role": "user", "content": ja}
+        ]
+    )
+    zh = chat.choices[0].message.content.strip()
+    # 获取带假名的日文（同一句在其他语言下已标注过则直接复用）
+    ja_with_furigana = known_ruby
+    if ja_with_furigana is None:
         furigana_chat = openai.ChatCompletion.create(
             model="gpt-4o-mini",
             messages=[
@@ -343,36 +481,368 @@ if st.session_state.segments:
             ]
         )
         ja_with_furigana = furigana_chat.choices[0].message.content.strip()
-        # 存储每句的分析数据
-        transcript_data.append({
-            "index": i,
-            "start": start_ts,
-            "end": end_ts,
-            "ja": ja,
-            "zh": zh,
-            "ja_with_furigana": ja_with_furigana
-        })
-        # 拼接 VTT 字幕内容
-        vtt += f"{i}\n{start_ts} --> {end_ts}\n{ja}\n{zh}\n\n"
-
-    # Base64 编码视频和 VTT
-    with open(st.session_state.tmp_path, 'rb') as f:
-        video_b64 = base64.b64encode(f.read()).decode()
+    tm.add(language, ja, zh, ja_with_furigana)
+    return zh, ja_with_furigana
+
+# ========== Whisper 转写与智能分句 ==========
+def transcribe_audio(path):
+    """调用 Whisper 转写一段音频，返回带起止时间的 segments 列表"""
+    with open(path, "rb") as f:
+        resp = openai.Audio.transcribe(
+            file=f,
+            model="whisper-1",
+            response_format="verbose_json"
+        )
+    return resp.get("segments", [])
+
+def merge_sentences(raw_sentences):
+    """调用大模型合并被错误拆分的 Whisper 分句，返回合并后的句子列表"""
+    # 构造大模型合并分句的提示词
+    merge_prompt = (
+        "是自动语音识别分割的日语句子列表，部分句子被错误拆分。"
+        "请你根据语义和语法，将应该合并的句子合并，输出合并后的完整日语句子列表（每句一行）：\n"
+        + "\n".join(f"{i+1}. {s}" for i, s in enumerate(raw_sentences))
+    )
+    merge_response = openai.ChatCompletion.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "你是日语母语者，擅长根据语义和语法判断句子边界。"},
+            {"role": "user", "content": merge_prompt}
+        ]
+    )
+    # 去除编号，只保留内容
+    merged_sentences = [re.sub(r'^[0-9]+[.、]\s*', '', line.strip()) for line in merge_response.choices[0].message.content.splitlines() if line.strip()]
+    # 用 Whisper 的第一句和大模型第一句做相似度判断，防止大模型输出提示语
+    if merged_sentences:
+        similarity = difflib.SequenceMatcher(None, raw_sentences[0], merged_sentences[0]).ratio()
+        if similarity < 0.2:
+            merged_sentences = merged_sentences[1:]
+    return merged_sentences
+
+# ========== 本地词汇表（离线词典） ==========
+# janome（IPADIC）词性到界面语言的对照，只保留需要列入词汇表的实词
+POS_LABELS = {
+    "名詞": {"中文": "名词", "English": "noun", "한국어": "명사"},
+    "動詞": {"中文": "动词", "English": "verb", "한국어": "동사"},
+    "形容詞": {"中文": "形容词", "English": "i-adjective", "한국어": "형용사"},
+    "形容動詞": {"中文": "形容动词", "English": "na-adjective", "한국어": "형용동사"},
+    "副詞": {"中文": "副词", "English": "adverb", "한국어": "부사"},
+    "連体詞": {"中文": "连体词", "English": "pre-noun adjectival", "한국어": "연체사"},
+    "接続詞": {"中文": "接续词", "English": "conjunction", "한국어": "접속사"},
+    "感動詞": {"中文": "感叹词", "English": "interjection", "한국어": "감탄사"},
+}
+
+@st.cache_resource
+def load_dictionary():
+    """
+    加载离线词典索引（python jmdict_index.py 编译生成）和分词器。
+    索引文件不存在时返回 None，单句分析回退为完全由大模型生成。
+    """
+    path = os.getenv("JMDICT_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jmdict.idx"))
+    if not os.path.exists(path):
+        return None
+    return DictionaryIndex(path), Tokenizer()
+
+def katakana_to_hiragana(text: str) -> str:
+    """片假名转平假名"""
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+def build_vocab_table(sentence, language):
+    """
+    分词后查本地词典，生成词汇表（Markdown 表格：词汇、假名读音、词性、释义）。
+    词典不可用或句中没有实词时返回 None。
+    """
+    resources = load_dictionary()
+    if resources is None:
+        return None
+    index, tokenizer = resources
+    lang = LANGUAGE_MAPPINGS[language]
+    rows = []
+    seen = set()
+    for token in tokenizer.tokenize(sentence):
+        pos = token.part_of_speech.split(",")
+        pos_key = "形容動詞" if pos[1] == "形容動詞語幹" else pos[0]
+        if pos_key not in POS_LABELS or pos[1] in ("非自立", "接尾", "数"):
+            continue
+        word = token.base_form if token.base_form != "*" else token.surface
+        if word in seen:
+            continue
+        seen.add(word)
+        entry = index.lookup(word)
+        if entry:
+            reading = entry.reading
+            meaning = entry.glosses.get(lang["dict_lang"]) or entry.glosses.get("en", "")
+        else:
+            # 词典未收录：活用形的读音不是原形读音，只保留未活用词的读音
+            reading = katakana_to_hiragana(token.reading) if token.surface == word and token.reading != "*" else ""
+            meaning = ""
+        rows.append(f"| {word} | {reading} | {POS_LABELS[pos_key][language]} | {meaning.replace('|', '/')} |")
+    if not rows:
+        return None
+    return lang["vocab_header"] + "\n" + "\n".join(rows)
+
+# ========== 单句分析提示词 ==========
+def build_analysis_prompt(sentence, language, with_vocab=False):
+    """
+    构造单句分析的提示词，返回 (系统提示, 用户提示)。
+    with_vocab 为 True 时词汇表已由本地词典生成，只请求语法点和句子整体分析。
+    """
+    if with_vocab:
+        if language == "中文":
+            analysis_prompt = f"""
+            请用中文详细分析以下日语句子（词汇表已由系统生成，无需再分析词汇），必须包含以下所有内容：
+
+            1. 语法点分析：
+               - 语法结构说明
+               - 用法解释
+               - 2-3个相关例句
+
+            2. 句子整体分析：
+               - 句子类型（陈述句、疑问句等）
+               - 语气和语感
+               - 使用场景
+
+            句子：{sentence}
+            """
+            system_prompt = "你是一个专业的日语教师，擅长用中文分析日语语法。请确保分析内容全面、准确、易懂。"
+        elif language == "English":
+            analysis_prompt = f"""
+            Please analyze the following Japanese sentence in detail (the vocabulary table has already been generated, do not analyze vocabulary), including ALL of the following:
+
+            1. Grammar Point Analysis:
+               - Grammar structure explanation
+               - Usage explanation
+               - 2-3 related example sentences
+
+            2. Overall Sentence Analysis:
+               - Sentence type (declarative, interrogative, etc.)
+               - Tone and nuance
+               - Usage context
+
+            Sentence: {sentence}
+            """
+            system_prompt = "You are a professional Japanese teacher, skilled in analyzing Japanese grammar in English. Please ensure the analysis is comprehensive, accurate, and easy to understand."
+        else:  # 韩文
+            analysis_prompt = f"""
+            다음 일본어 문장을 상세히 분석해주세요 (어휘표는 이미 생성되었으므로 어휘 분석은 필요 없습니다). 다음 내용을 모두 포함해야 합니다:
+
+            1. 문법 포인트 분석:
+               - 문법 구조 설명
+               - 용법 설명
+               - 관련 예문 2-3개
+
+            2. 전체 문장 분석:
+               - 문장 유형 (평서문, 의문문 등)
+               - 어조와 뉘앙스
+               - 사용 맥락
+
+            문장: {sentence}
+            """
+            system_prompt = "당신은 일본어 문법을 한국어로 분석하는 전문 일본어 교사입니다. 분석이 포괄적이고 정확하며 이해하기 쉽도록 해주세요."
+        return system_prompt, analysis_prompt
+
+    if language == "中文":
+        analysis_prompt = f"""
+        请用中文详细分析以下日语句子，必须包含以下所有内容：
+
+        1. 重点词汇分析（请用表格形式展示）：
+        | 词汇 | 假名读音 | 词性 | 中文意思 | 使用场景 |
+        |------|----------|------|----------|----------|
+        | 词汇1 | 假名1 | 词性1 | 意思1 | 场景1 |
+        | 词汇2 | 假名2 | 词性2 | 意思2 | 场景2 |
+        ...
+
+        2. 语法点分析：
+           - 语法结构说明
+           - 用法解释
+           - 2-3个相关例句
+        
+        3. 句子整体分析：
+           - 句子类型（陈述句、疑问句等）
+           - 语气和语感
+           - 使用场景
+        
+        句子：{sentence}
+        """
+        system_prompt = "你是一个专业的日语教师，擅长用中文分析日语语法和词汇。请确保分析内容全面、准确、易懂。重点词汇分析必须使用表格形式展示。"
+    elif language == "English":
+        analysis_prompt = f"""
+        Please analyze the following Japanese sentence in detail, including ALL of the following:
+
+        1. Important Vocabulary Analysis (Please present in table format):
+        | Vocabulary | Furigana | Part of Speech | English Meaning | Usage Context |
+        |------------|----------|----------------|-----------------|---------------|
+        | Word 1 | Furigana 1 | POS 1 | Meaning 1 | Context 1 |
+        | Word 2 | Furigana 2 | POS 2 | Meaning 2 | Context 2 |
+        ...
+
+        2. Grammar Point Analysis:
+           - Grammar structure explanation
+           - Usage explanation
+           - 2-3 related example sentences
+        
+        3. Overall Sentence Analysis:
+           - Sentence type (declarative, interrogative, etc.)
+           - Tone and nuance
+           - Usage context
+        
+        Sentence: {sentence}
+        """
+        system_prompt = "You are a professional Japanese teacher, skilled in analyzing Japanese grammar and vocabulary in English. Please ensure the analysis is comprehensive, accurate, and easy to understand. Important vocabulary analysis must be presented in table format."
+    else:  # 韩文
+        analysis_prompt = f"""
+        다음 일본어 문장을 상세히 분석해주세요. 다음 내용을 모두 포함해야 합니다:
+
+        1. 중요 어휘 분석 (표 형식으로 제시):
+        | 어휘 | 후리가나 | 품사 | 한국어 의미 | 사용 맥락 |
+        |------|----------|------|------------|----------|
+        | 어휘1 | 후리가나1 | 품사1 | 의미1 | 맥락1 |
+        | 어휘2 | 후리가나2 | 품사2 | 의미2 | 맥락2 |
+        ...
+
+        2. 문법 포인트 분석:
+           - 문법 구조 설명
+           - 용법 설명
+           - 관련 예문 2-3개
+        
+        3. 전체 문장 분석:
+           - 문장 유형 (평서문, 의문문 등)
+           - 어조와 뉘앙스
+           - 사용 맥락
+        
+        문장: {sentence}
+        """
+        system_prompt = "당신은 일본어 문법과 어휘를 한국어로 분석하는 전문 일본어 교사입니다. 분석이 포괄적이고 정확하며 이해하기 쉽도록 해주세요. 중요 어휘 분석은 반드시 표 형식으로 제시해야 합니다."
+    return system_prompt, analysis_prompt
+
+# ========== 点击句子 ==========
+def select_sentence(sentence, language):
+    """
+    句子按钮的回调，在重新运行脚本之前执行。
+    词汇表（本地词典或已缓存的分析）在这里准备好，重新运行时先于全文列表显示，不必等待整个页面渲染完成。
+    """
+    st.session_state.clicked_sentence = sentence
+    st.session_state.current_sentence = sentence
+    cached = (load_lesson_data("analyses") or {}).get((language, sentence))
+    if cached:
+        # 已分析过（或课程包中已包含）的句子直接显示
+        session_store.store(st.session_state, "last_vocab", cached[0])
+        session_store.store(st.session_state, "last_analysis", cached[1])
+        st.session_state.analysis_pending = False
+    else:
+        # 本地词典生成的词汇表立即显示，语法分析在页面底部调用大模型生成
+        session_store.store(st.session_state, "last_vocab", build_vocab_table(sentence, language))
+        session_store.store(st.session_state, "last_analysis", None)
+        st.session_state.analysis_pending = True
+
+# ========== 流式处理：音频提取 → 转写 → 分句 → 翻译 ==========
+# 各阶段并行执行，每确定一句就立即翻译并显示，无需等待整个文件处理完成
+if st.session_state.processing:
+    st.session_state.processing = False
+    tm = get_translation_memory()
+    language = selected_language
+    pipeline = StreamingPipeline(
+        st.session_state.tmp_path,
+        transcribe=transcribe_audio,
+        merge=merge_sentences,
+        translate=lambda ja: translate_sentence(ja, language, tm),
+    )
+    transcript_data = []
+    # 处理过程中逐句显示预览，完成后由下方的播放器替换
+    preview = st.empty()
+    preview_rows = preview.container()
+    try:
+        with st.spinner(current_lang["transcribing"]):
+            for index, start, end, ja, zh, ja_with_furigana in pipeline.run():
+                item = TranscriptLine(index, fmt(start), fmt(end), ja, zh, ja_with_furigana)
+                transcript_data.append(item)
+                preview_rows.markdown(f"`{item.start}` {item.ja_with_furigana}<br>{item.zh}", unsafe_allow_html=True)
+    except Exception as e:
+        st.error(f"转写过程中出错: {str(e)}")
+        st.stop()
+    for warning in dict.fromkeys(pipeline.warnings):
+        st.warning(f"智能合并分句时出错: {warning}，该部分使用原始分句。")
+    preview.empty()
+    if transcript_data:
+        # 只保留起止时间和文本的紧凑结构，过大时溢出到磁盘
+        session_store.store(st.session_state, "segments", SegmentTable.from_rows(pipeline.segments))
+        session_store.store(st.session_state, "merged_sentences", pipeline.sentences)
+        session_store.store(st.session_state, "transcripts", {language: transcript_data})
+
+# ========== Whisper转写后主流程 ==========
+if st.session_state.lesson_path or st.session_state.segments is not None:
+    # 单句朗读模块标题
+    st.markdown(f'<h2 class="module-title">{current_lang["reading_module"]}</h2>', unsafe_allow_html=True)
+
+    # 按界面语言缓存的字幕行，切换回已生成过的语言时无需重新翻译
+    transcripts = session_store.load(st.session_state, "transcripts") or {}
+    transcript_data = transcripts.get(selected_language)
+    if transcript_data is None and st.session_state.lesson_path:
+        # 导入的课程包中已有该语言的字幕
+        with LessonPackage(st.session_state.lesson_path) as lesson:
+            transcript_data = lesson.transcript(selected_language)
+        if transcript_data is not None:
+            transcripts[selected_language] = transcript_data
+            session_store.store(st.session_state, "transcripts", transcripts)
+    if transcript_data is None:
+        segments = load_lesson_data("segments")
+        merged_sentences = load_lesson_data("merged_sentences")
+        if merged_sentences is None:
+            raw_sentences = segments.texts
+            try:
+                merged_sentences = merge_sentences(raw_sentences)
+            except Exception as e:
+                st.error(f"智能合并分句时出错: {str(e)}，将使用原始分句。")
+                merged_sentences = list(raw_sentences)
+            session_store.store(st.session_state, "merged_sentences", merged_sentences)
+        transcript_data = []
+        tm = get_translation_memory()
+        # 其他语言的字幕中已有每句的起止时间（流水线按分句对齐得到），直接沿用
+        timings = next((lines for lines in transcripts.values() if len(lines) == len(merged_sentences)), None)
+        for i, ja in enumerate(merged_sentences, start=1):
+            # 计算每句的起止时间戳
+            if timings:
+                start_ts, end_ts = timings[i-1].start, timings[i-1].end
+            else:
+                start_ts = fmt(segments.starts[0]) if i == 1 else fmt(segments.ends[i-1])
+                end_ts = fmt(segments.ends[i]) if i < len(segments) else fmt(segments.ends[-1])
+            # 翻译并标注假名（优先复用翻译记忆）
+            zh, ja_with_furigana = translate_sentence(ja, selected_language, tm)
+            # 存储每句的分析数据
+            transcript_data.append(TranscriptLine(i, start_ts, end_ts, ja, zh, ja_with_furigana))
+        transcripts[selected_language] = transcript_data
+        session_store.store(st.session_state, "transcripts", transcripts)
+
+    # 生成 WebVTT 字幕
+    vtt = "WEBVTT\n\n" + "".join(
+        f"{item.index}\n{item.start} --> {item.end}\n{item.ja}\n{item.zh}\n\n" for item in transcript_data
+    )
+
+    # 音视频通过媒体文件服务按 URL 加载，只有体积很小的 VTT 字幕内嵌为 Base64
+    # 导入的课程包直接按区间读取包内的音视频数据，不另外写出临时文件
+    video_url, video_type = "", media_mimetype(None)
+    if st.session_state.lesson_path:
+        with LessonPackage(st.session_state.lesson_path) as lesson:
+            if lesson.has_media():
+                video_type = media_mimetype(lesson.media_suffix)
+                video_url = media_url(st.session_state.lesson_path, video_type, *lesson.media_range())
+    elif st.session_state.tmp_path:
+        video_type = media_mimetype(os.path.splitext(st.session_state.tmp_path)[1])
+        video_url = media_url(st.session_state.tmp_path, video_type)
     subtitle_b64 = base64.b64encode(vtt.encode()).decode()
 
     # 构建全文翻译 HTML
-    transcript_html = ""
-    for item in transcript_data:
-        transcript_html += f"""
-        <div class="transcript-line" id="line-{item['index']}" onclick="handleSentenceClick({item['index']}, '{item['start']}', '{item['ja']}')" data-start="{item['start']}" data-end="{item['end']}">
-          <div class="ja">{item['ja_with_furigana']}</div>
-          <div class="zh">{item['zh']}</div>
+    # 模块级变量上的 += 不会原地扩展字符串，长字幕逐行拼接是平方复杂度，这里一次 join
+    transcript_html = "".join(f"""
+        <div class="transcript-line" id="line-{item.index}" data-index="{item.index}" data-start="{item.start}" data-end="{item.end}" data-ja="{html_lib.escape(item.ja)}">
+          <div class="ja">{item.ja_with_furigana}</div>
+          <div class="zh">{item.zh}</div>
           <div class="button-group">
-            <button class="loop-button" onclick="handleLoopPlay({item['index']}, '{item['start']}', '{item['end']}')">{current_lang['loop_play']}</button>
-            <button class="cancel-loop-button" onclick="handleCancelLoop({item['index']})" style="display: none;">{current_lang['cancel_loop']}</button>
+            <button class="loop-button" data-action="loop">{current_lang['loop_play']}</button>
+            <button class="cancel-loop-button" data-action="cancel-loop" style="display: none;">{current_lang['cancel_loop']}</button>
           </div>
         </div>
-        """
+        """ for item in transcript_data)
 
     # 综合 HTML: 左侧视频，不显示自带字幕；右侧全文并红色高亮当前句式
     html = f"""
@@ -483,7 +953,7 @@ if st.session_state.segments:
       <div class="video-section">
         <div class="video-container">
           <video id="vid" controls crossorigin>
-            <source src="data:video/mp4;base64,{video_b64}" type="video/mp4">
+            <source src="{video_url}" type="{video_type}">
             <track kind="subtitles" srclang="ja" label="日/中" src="data:text/vtt;base64,{subtitle_b64}" default>
           </video>
         </div>
@@ -493,165 +963,49 @@ if st.session_state.segments:
       </div>
     </div>
     <script>
-      const video = document.getElementById('vid');
-      const transcriptSection = document.getElementById('full-transcript');
-      let currentHighlightedIndex = null;
-      let isManualHighlight = false;
-      let loopInterval = null;
-      let currentLoopingIndex = null;
-
-      function clearHighlights() {{
-        const lines = transcriptSection.getElementsByClassName('transcript-line');
-        for (let line of lines) {{ 
-          line.classList.remove('highlight');
-          line.classList.remove('looping');
-        }}
-      }}
-
-      function parseTimestamp(timestamp) {{
-        const [time, ms] = timestamp.split('.');
-        const [hours, minutes, seconds] = time.split(':');
-        return parseFloat(hours) * 3600 + parseFloat(minutes) * 60 + parseFloat(seconds) + parseFloat('0.' + ms);
-      }}
-
-      function highlightSentence(index) {{
-        clearHighlights();
-        const el = document.getElementById('line-' + index);
-        if (el) {{
-          el.classList.add('highlight');
-          el.scrollIntoView({{ behavior: 'smooth', block: 'nearest' }});
-          currentHighlightedIndex = index;
-        }}
-      }}
-
-      function handleSentenceClick(index, timestamp, sentence) {{
-        // 发送消息到 Streamlit
-        window.parent.postMessage({{
-          type: 'sentence_click',
-          data: {{
-            index: index,
-            timestamp: timestamp,
-            sentence: sentence
-          }}
-        }}, '*');
-
-        // 跳转到视频时间点
-        const totalSeconds = parseTimestamp(timestamp);
-        video.currentTime = totalSeconds;
-        
-        // 高亮显示当前句子
-        highlightSentence(index);
-        isManualHighlight = true;
-
-        // 设置一个定时器，在视频开始播放后重置手动高亮状态
-        setTimeout(() => {{
-          isManualHighlight = false;
-        }}, 1000);
-      }}
-
-      function handleLoopPlay(index, startTime, endTime) {{
-        // 阻止事件冒泡，防止触发句子的点击事件
-        event.stopPropagation();
-        
-        // 清除之前的循环
-        if (loopInterval) {{
-          clearInterval(loopInterval);
-        }}
-        
-        // 设置视频的当前时间到句子开始时间
-        const startSeconds = parseTimestamp(startTime);
-        const endSeconds = parseTimestamp(endTime);
-        video.currentTime = startSeconds;
-        
-        // 播放视频
-        video.play();
-        
-        // 设置循环播放
-        loopInterval = setInterval(() => {{
-          if (video.currentTime >= endSeconds) {{
-            video.currentTime = startSeconds;
-          }}
-        }}, 100);
-
-        // 更新UI状态
-        clearHighlights();
-        const el = document.getElementById('line-' + index);
-        if (el) {{
-          el.classList.add('highlight');
-          el.classList.add('looping');
-          currentLoopingIndex = index;
-        }}
-      }}
-
-      function handleCancelLoop(index) {{
-        // 阻止事件冒泡
-        event.stopPropagation();
-        
-        // 清除循环播放
-        if (loopInterval) {{
-          clearInterval(loopInterval);
-          loopInterval = null;
-        }}
-        
-        // 更新UI状态
-        const el = document.getElementById('line-' + index);
-        if (el) {{
-          el.classList.remove('looping');
-        }}
-        currentLoopingIndex = null;
-        
-        // 继续播放视频
-        video.play();
-      }}
-
-      video.addEventListener('loadedmetadata', () => {{
-        const track = video.textTracks[0];
-        track.mode = 'hidden';  // 隐藏渲染但保留 cue 事件
-
-        track.addEventListener('cuechange', () => {{
-          const activeCues = track.activeCues;
-          if (activeCues.length > 0) {{
-            const cue = activeCues[0];
-            const cues = track.cues;
-            for (let i = 0; i < cues.length; i++) {{
-              if (cues[i] === cue) {{
-                const idx = i + 1;
-                // 只有在没有手动高亮且没有循环播放时才自动更新高亮
-                if (!isManualHighlight && !currentLoopingIndex) {{
-                  highlightSentence(idx);
-                }}
-                break;
-              }}
-            }}
-          }}
-        }});
-
-        // 添加视频播放事件监听
-        video.addEventListener('play', () => {{
-          // 开始播放时重置手动高亮状态
-          isManualHighlight = false;
-        }});
-
-        video.addEventListener('pause', () => {{
-          // 暂停时清除循环播放
-          if (loopInterval) {{
-            clearInterval(loopInterval);
-            loopInterval = null;
-            if (currentLoopingIndex) {{
-              const el = document.getElementById('line-' + currentLoopingIndex);
-              if (el) {{
-                el.classList.remove('looping');
-              }}
-              currentLoopingIndex = null;
-            }}
-          }}
-        }});
-      }});
+      {load_player_script()}
+      initTranscriptPlayer(document.getElementById('vid'), document.getElementById('full-transcript'));
     </script>
     """
 
     st.components.v1.html(html, height=650, scrolling=False)
 
+    # 导出课程包：字幕、各语言译文、假名、已缓存的分析和（可选）音视频
+    with st.sidebar:
+        include_media = st.checkbox(current_lang["lesson_include_media"], value=True, disabled=not video_url)
+        if st.button(current_lang["lesson_export"]):
+            export_transcripts = dict(transcripts)
+            export_media = st.session_state.tmp_path
+            if st.session_state.lesson_path:
+                with LessonPackage(st.session_state.lesson_path) as lesson:
+                    for language in lesson.languages:
+                        if language not in export_transcripts:
+                            export_transcripts[language] = lesson.transcript(language)
+                    # 导出时才把课程包中的音视频写出为临时文件
+                    if include_media and lesson.has_media():
+                        export_media = os.path.join(session_store.session_dir(st.session_state), "export-media" + lesson.media_suffix)
+                        lesson.extract_media(export_media)
+            # 每次导出覆盖同一个文件
+            export_path = os.path.join(session_store.session_dir(st.session_state), "export" + lesson_package.FILE_SUFFIX)
+            write_lesson(
+                export_path, load_lesson_data("segments"), load_lesson_data("merged_sentences"), export_transcripts,
+                analyses=load_lesson_data("analyses"),
+                media_path=export_media if include_media else None
+            )
+            if export_media != st.session_state.tmp_path:
+                session_store.remove_file(export_media)
+            if st.session_state.lesson_path:
+                export_name = st.session_state.lesson_key[0]
+            elif st.session_state.upload_key:
+                export_name = os.path.splitext(st.session_state.upload_key[0])[0] + lesson_package.FILE_SUFFIX
+            else:
+                export_name = "lesson" + lesson_package.FILE_SUFFIX
+            with open(export_path, "rb") as f:
+                st.download_button(current_lang["lesson_download"], f, file_name=export_name, mime="application/octet-stream")
+
+    # 提前加载词典和分词器（每个进程只加载一次），首次点击句子时不必等待
+    load_dictionary()
+
     # 添加模块标题
     st.markdown(f'<h2 class="module-title">{current_lang["analysis_module"]}</h2>', unsafe_allow_html=True)
     st.markdown(f"#### {current_lang['full_text']}")
@@ -661,12 +1015,33 @@ if st.session_state.segments:
         st.session_state.clicked_sentence = None
     if 'last_analysis' not in st.session_state:
         st.session_state.last_analysis = None
+    if 'last_vocab' not in st.session_state:
+        st.session_state.last_vocab = None
+    if 'analysis_pending' not in st.session_state:
+        st.session_state.analysis_pending = False
     
     # 显示提示信息
     st.markdown(f"> <span style='color: #FFD700;'>{current_lang['hover_tip']}</span>", unsafe_allow_html=True)
     
-    # 创建一个容器来显示全文
+    # 创建一个容器来显示全文，下方的容器显示单句分析
+    # 分析区先于全文列表渲染：长字幕有上千行按钮，点击后词汇表不必等待列表重新生成
     full_text_container = st.container()
+    analysis_container = st.container()
+
+    # 显示分析结果（词汇表）
+    last_analysis = session_store.load(st.session_state, "last_analysis")
+    show_analysis = bool(last_analysis or st.session_state.analysis_pending)
+    last_vocab = None
+    if show_analysis:
+        with analysis_container:
+            st.markdown("---")
+            st.markdown(f"### {current_lang['sentence_analysis']}")
+            st.markdown(f"**{current_lang['current_sentence']}** {st.session_state.current_sentence}")
+            # 本地词汇表先显示，不等待大模型
+            last_vocab = session_store.load(st.session_state, "last_vocab")
+            if last_vocab:
+                st.markdown(f"#### {current_lang['vocab_title']}")
+                st.markdown(last_vocab)
     
     # 在容器中显示全文
     with full_text_container:
@@ -708,117 +1083,68 @@ if st.session_state.segments:
             cols = st.columns([3, 1])
             
             with cols[0]:
-                # 日文原文按钮
-                if st.button(
-                    f"[{item['index']}] {item['ja']}",
-                    key=f"sentence_{item['index']}",
+                # 日文原文按钮（标签带序号，不会重复）
+                # 不指定 key：Streamlit 1.32 每次访问 st.session_state 都会重建所有控件 key 的映射，
+                # 上千个带 key 的按钮会让整个脚本中的每次访问都变慢
+                st.button(
+                    f"[{item.index}] {item.ja}",
                     help=current_lang['click_to_analyze'],
-                    use_container_width=True
-                ):
-                    sentence = item["ja"]
-                    st.session_state.clicked_sentence = sentence
-                    
-                    # 根据选择的语言设置分析提示
-                    if selected_language == "中文":
-                        analysis_prompt = f"""
-                        请用中文详细分析以下日语句子，必须包含以下所有内容：
-
-                        1. 重点词汇分析（请用表格形式展示）：
-                        | 词汇 | 假名读音 | 词性 | 中文意思 | 使用场景 |
-                        |------|----------|------|----------|----------|
-                        | 词汇1 | 假名1 | 词性1 | 意思1 | 场景1 |
-                        | 词汇2 | 假名2 | 词性2 | 意思2 | 场景2 |
-                        ...
-
-                        2. 语法点分析：
-                           - 语法结构说明
-                           - 用法解释
-                           - 2-3个相关例句
-                        
-                        3. 句子整体分析：
-                           - 句子类型（陈述句、疑问句等）
-                           - 语气和语感
-                           - 使用场景
-                        
-                        句子：{sentence}
-                        """
-                        system_prompt = "你是一个专业的日语教师，擅长用中文分析日语语法和词汇。请确保分析内容全面、准确、易懂。重点词汇分析必须使用表格形式展示。"
-                    elif selected_language == "English":
-                        analysis_prompt = f"""
-                        Please analyze the following Japanese sentence in detail, including ALL of the following:
-
-                        1. Important Vocabulary Analysis (Please present in table format):
-                        | Vocabulary | Furigana | Part of Speech | English Meaning | Usage Context |
-                        |------------|----------|----------------|-----------------|---------------|
-                        | Word 1 | Furigana 1 | POS 1 | Meaning 1 | Context 1 |
-                        | Word 2 | Furigana 2 | POS 2 | Meaning 2 | Context 2 |
-                        ...
-
-                        2. Grammar Point Analysis:
-                           - Grammar structure explanation
-                           - Usage explanation
-                           - 2-3 related example sentences
-                        
-                        3. Overall Sentence Analysis:
-                           - Sentence type (declarative, interrogative, etc.)
-                           - Tone and nuance
-                           - Usage context
-                        
-                        Sentence: {sentence}
-                        """
-                        system_prompt = "You are a professional Japanese teacher, skilled in analyzing Japanese grammar and vocabulary in English. Please ensure the analysis is comprehensive, accurate, and easy to understand. Important vocabulary analysis must be presented in table format."
-                    else:  # 韩文
-                        analysis_prompt = f"""
-                        다음 일본어 문장을 상세히 분석해주세요. 다음 내용을 모두 포함해야 합니다:
-
-                        1. 중요 어휘 분석 (표 형식으로 제시):
-                        | 어휘 | 후리가나 | 품사 | 한국어 의미 | 사용 맥락 |
-                        |------|----------|------|------------|----------|
-                        | 어휘1 | 후리가나1 | 품사1 | 의미1 | 맥락1 |
-                        | 어휘2 | 후리가나2 | 품사2 | 의미2 | 맥락2 |
-                        ...
-
-                        2. 문법 포인트 분석:
-                           - 문법 구조 설명
-                           - 용법 설명
-                           - 관련 예문 2-3개
-                        
-                        3. 전체 문장 분석:
-                           - 문장 유형 (평서문, 의문문 등)
-                           - 어조와 뉘앙스
-                           - 사용 맥락
-                        
-                        문장: {sentence}
-                        """
-                        system_prompt = "당신은 일본어 문법과 어휘를 한국어로 분석하는 전문 일본어 교사입니다. 분석이 포괄적이고 정확하며 이해하기 쉽도록 해주세요. 중요 어휘 분석은 반드시 표 형식으로 제시해야 합니다."
-                    
-                    try:
-                        analysis = openai.ChatCompletion.create(
-                            model="gpt-4o-mini",
-                            messages=[
-                                {"role": "system", "content": system_prompt},
-                                {"role": "user", "content": analysis_prompt}
-                            ]
-                        )
-                        
-                        # 更新分析结果
-                        st.session_state.last_analysis = analysis.choices[0].message.content
-                        st.session_state.current_sentence = sentence
-                    except Exception as e:
-                        st.error(f"分析过程中出现错误: {str(e)}")
+                    use_container_width=True,
+                    on_click=select_sentence,
+                    args=(item.ja, selected_language)
+                )
             
             with cols[1]:
                 # 中文翻译
                 st.markdown(
-                    f"<div style='padding-top: 8px;'><span class='sentence-number'>[{item['index']}]</span>{item['zh']}</div>", 
+                    f"<div style='padding-top: 8px;'><span class='sentence-number'>[{item.index}]</span>{item.zh}</div>", 
                     unsafe_allow_html=True
                 )
     
-    # 显示分析结果
-    if st.session_state.last_analysis:
-        st.markdown("---")
-        st.markdown(f"### {current_lang['sentence_analysis']}")
-        st.markdown(f"**{current_lang['current_sentence']}** {st.session_state.current_sentence}")
-        st.markdown(st.session_state.last_analysis)
+    # 显示分析结果（语法分析）：全文列表渲染完成后再等待大模型
+    if show_analysis:
+        with analysis_container:
+            if st.session_state.analysis_pending:
+                st.session_state.analysis_pending = False
+                system_prompt, analysis_prompt = build_analysis_prompt(st.session_state.current_sentence, selected_language, with_vocab=bool(last_vocab))
+                try:
+                    with st.spinner():
+                        analysis = openai.ChatCompletion.create(
+                            model="gpt-4o-mini",
+                            messages=[
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": analysis_prompt}
+                            ]
+                        )
+                    # 更新分析结果
+                    last_analysis = analysis.choices[0].message.content
+                    session_store.store(st.session_state, "last_analysis", last_analysis)
+                    analyses = load_lesson_data("analyses") or {}
+                    analyses[(selected_language, st.session_state.current_sentence)] = (last_vocab, last_analysis)
+                    session_store.store(st.session_state, "analyses", analyses)
+                except Exception as e:
+                    st.error(f"分析过程中出现错误: {str(e)}")
+            if last_analysis:
+                st.markdown(last_analysis)
+
+# ========== 会话内存占用统计 ==========
+# 在页面渲染完成后统计，结果显示在侧边栏底部
+with st.sidebar.expander(current_lang["memory_stats"]):
+    # 音视频和课程包由媒体文件服务直接从磁盘读取，只计入磁盘占用
+    footprint = session_store.session_footprint(st.session_state, files={
+        "media": st.session_state.tmp_path,
+        "upload": st.session_state.upload_path if st.session_state.upload_path != st.session_state.tmp_path else None,
+        "lesson": st.session_state.lesson_path,
+    })
+    stats_md = "| key | RAM (KB) | Disk (KB) |\n|---|---:|---:|\n"
+    stats_md += "".join(f"| {key} | {ram / 1024:.1f} | {disk / 1024:.1f} |\n" for key, ram, disk in footprint)
+    stats_md += f"| **{current_lang['memory_total']}** | **{sum(r[1] for r in footprint) / 1024:.1f}** | **{sum(r[2] for r in footprint) / 1024:.1f}** |"
+    st.markdown(stats_md)
+    st.caption(f"SESSION_SPILL_THRESHOLD_MB = {session_store.SPILL_THRESHOLD_MB:g}")
+    tm = get_translation_memory()
+    st.caption(
+        f"{current_lang['tm_stats']}: {tm.hit_rate():.0%} "
+        f"(exact {tm.stats['exact']} / fuzzy {tm.stats['fuzzy']} / fallback {tm.stats['fuzzy_fallback']} / miss {tm.stats['miss']}, {len(tm)} entries)"
+    )
 
 st.snow()
\ No newline at end of file
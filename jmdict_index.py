@@ -0,0 +1,183 @@
+# =====================
+# 离线词典索引
+# =====================
+# 将 JMdict（XML）编译为紧凑的只读查找表文件，运行时通过内存映射 + 二分查找实现微秒级查词，
+# 供单句分析模块在本地直接生成词汇表（读音、词性、释义），无需调用大模型。
+#
+# 编译方法：
+#   python jmdict_index.py JMdict_e.xml -o jmdict.idx
+#   python jmdict_index.py JMdict.xml -o jmdict.idx --gloss zh=ja_zh.tsv --gloss ko=ja_ko.tsv
+# JMdict 只提供英文等欧洲语言释义，中文、韩文释义可通过 --gloss 指定「词条<TAB>释义」格式的补充文件。
+#
+# 文件格式（整数均为小端）：
+#   8 字节魔数 | uint32 条目数 N | (N+1) 个 uint32 记录偏移 | N 条记录
+#   每条记录：uint16 键长度 | 键（UTF-8） | 值（UTF-8，字段以 \x1f 分隔：读音、en、zh、ko 释义）
+# 记录按键的 UTF-8 字节序排序。
+
+import os
+import sys
+import mmap
+import struct
+import argparse
+import xml.etree.ElementTree as ET
+
+MAGIC = b"NHDICT\x00\x01"
+GLOSS_LANGS = ("en", "zh", "ko")
+# JMdict 中 gloss 的 xml:lang 属性与本索引语言代码的对应关系
+JMDICT_LANGS = {"eng": "en"}
+# 每个词条最多保留的义项数
+MAX_SENSES = 3
+
+_XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+_SEP = "\x1f"
+
+
+class DictEntry:
+    """查词结果：读音（平假名）与各语言释义"""
+    __slots__ = ("word", "reading", "glosses")
+
+    def __init__(self, word, reading, glosses):
+        self.word = word
+        self.reading = reading
+        self.glosses = glosses
+
+
+# ========== 编译 ==========
+def parse_jmdict(path):
+    """
+    流式解析 JMdict XML，返回 {词条: (读音, {语言代码: 释义})}。
+    汉字写法和假名写法都会作为键写入，同一个键只保留第一个词条。
+    假名写法的读音就是它本身；汉字写法取第一个适用于它的假名写法（遵守 re_restr / re_nokanji）。
+    """
+    entries = {}
+    for _, elem in ET.iterparse(path, events=("end",)):
+        if elem.tag != "entry":
+            continue
+        kebs = [k.text for k in elem.iter("keb") if k.text]
+        # (假名写法, 限定的汉字写法集合, 是否不适用于任何汉字写法)
+        rebs = []
+        for r_ele in elem.iter("r_ele"):
+            reb = r_ele.findtext("reb")
+            if reb:
+                restr = {r.text for r in r_ele.iter("re_restr") if r.text}
+                rebs.append((reb, restr, r_ele.find("re_nokanji") is not None))
+        glosses = {}
+        for sense in elem.iter("sense"):
+            by_lang = {}
+            for gloss in sense.iter("gloss"):
+                code = JMDICT_LANGS.get(gloss.get(_XML_LANG, "eng"))
+                if code and gloss.text:
+                    by_lang.setdefault(code, []).append(gloss.text)
+            for code, texts in by_lang.items():
+                senses = glosses.setdefault(code, [])
+                if len(senses) < MAX_SENSES:
+                    senses.append(", ".join(texts[:3]))
+        glosses = {code: "; ".join(senses) for code, senses in glosses.items()}
+        # 每个键使用独立的释义 dict，补充释义只写入对应的键
+        for keb in kebs:
+            reading = next((reb for reb, restr, nokanji in rebs if not nokanji and (not restr or keb in restr)), "")
+            entries.setdefault(keb, (reading, dict(glosses)))
+        for reb, _, _ in rebs:
+            entries.setdefault(reb, (reb, dict(glosses)))
+        elem.clear()
+    return entries
+
+
+def merge_glosses(entries, lang, path):
+    """合并补充释义文件（每行「词条<TAB>释义」），只作用于 JMdict 中已有的词条"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            word, _, gloss = line.rstrip("\n").partition("\t")
+            if word in entries and gloss:
+                entries[word][1].setdefault(lang, gloss)
+
+
+def write_index(entries, out_path):
+    """将词条写入索引文件"""
+    records = []
+    for word, (reading, glosses) in entries.items():
+        key = word.encode("utf-8")
+        value = _SEP.join([reading] + [glosses.get(code, "").replace(_SEP, " ") for code in GLOSS_LANGS])
+        records.append((key, value.encode("utf-8")))
+    records.sort(key=lambda record: record[0])
+
+    header_size = len(MAGIC) + 4 + 4 * (len(records) + 1)
+    offsets = [header_size]
+    for key, value in records:
+        offsets.append(offsets[-1] + 2 + len(key) + len(value))
+    with open(out_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(records)))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        for key, value in records:
+            f.write(struct.pack("<H", len(key)))
+            f.write(key)
+            f.write(value)
+    return len(records)
+
+
+# ========== 查询 ==========
+class DictionaryIndex:
+    """内存映射的只读词典索引，查词为二分查找，不会把整个文件读入内存"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"不是有效的词典索引文件: {path}")
+        (self.count,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        self._offsets_at = len(MAGIC) + 4
+
+    def __len__(self):
+        return self.count
+
+    def _offset(self, i):
+        return struct.unpack_from("<I", self._mm, self._offsets_at + 4 * i)[0]
+
+    def _key(self, start):
+        (key_len,) = struct.unpack_from("<H", self._mm, start)
+        return self._mm[start + 2:start + 2 + key_len]
+
+    def lookup(self, word):
+        """查找词条，未收录时返回 None"""
+        target = word.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._offset(mid)
+            key = self._key(start)
+            if key < target:
+                lo = mid + 1
+            elif key > target:
+                hi = mid
+            else:
+                value = self._mm[start + 2 + len(key):self._offset(mid + 1)].decode("utf-8")
+                fields = value.split(_SEP)
+                return DictEntry(word, fields[0], dict(zip(GLOSS_LANGS, fields[1:])))
+        return None
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="将 JMdict XML 编译为离线词典索引")
+    parser.add_argument("jmdict", help="JMdict 或 JMdict_e 的 XML 文件路径")
+    parser.add_argument("-o", "--output", default="jmdict.idx", help="输出的索引文件路径")
+    parser.add_argument("--gloss", action="append", default=[], metavar="LANG=PATH",
+                        help="补充释义文件，例如 zh=ja_zh.tsv（可重复指定）")
+    args = parser.parse_args(argv)
+
+    entries = parse_jmdict(args.jmdict)
+    for spec in args.gloss:
+        lang, _, path = spec.partition("=")
+        if lang not in GLOSS_LANGS or not path:
+            parser.error(f"无效的 --gloss 参数: {spec}")
+        merge_glosses(entries, lang, path)
+    count = write_index(entries, args.output)
+    print(f"已写入 {count} 个词条 -> {args.output} ({os.path.getsize(args.output) / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# =====================
+# 课程包（.nhlesson）导入导出
+# =====================
+# 将处理完成的音视频（分段时间戳、合并后的句子、各语言译文和假名、已缓存的单句分析、可选的音视频文件）
+# 打包为一个带版本号的紧凑文件，导入时跳过转写、分句、翻译等全部处理步骤。
+#
+# 文件格式（整数均为小端）：
+#   8 字节魔数 | uint16 格式版本 | uint32 头部长度 | 头部 JSON | 各数据段
+# 头部 JSON 记录每个数据段相对数据区起点的偏移、长度和编码方式：
+#   zlib —— zlib 压缩的 JSON；raw —— 原始字节（音视频本身已是压缩格式，不再压缩）
+# 读取时整个文件通过内存映射打开，各数据段在首次访问时才解压。
+
+import os
+import json
+import mmap
+import time
+import zlib
+import shutil
+import struct
+
+from session_store import SegmentTable, TranscriptLine
+
+MAGIC = b"NHLESSON"
+SCHEMA_VERSION = 1
+FILE_SUFFIX = ".nhlesson"
+_PREFIX = struct.Struct("<8sHI")
+
+
+def _encode(obj):
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def write_lesson(path, segments, merged_sentences, transcripts, analyses=None, media_path=None):
+    """
+    写入课程包。
+    transcripts 为 {界面语言: [TranscriptLine, ...]}，analyses 为 {(界面语言, 句子): (词汇表, 分析)}。
+    media_path 不为空时把音视频原文件一并写入。
+    """
+    sections = {
+        "segments": _encode({"starts": list(segments.starts), "ends": list(segments.ends), "texts": segments.texts}),
+        "merged": _encode(merged_sentences),
+        "analyses": _encode([[lang, sentence, vocab, analysis] for (lang, sentence), (vocab, analysis) in (analyses or {}).items()]),
+    }
+    for language, lines in transcripts.items():
+        sections[f"transcript/{language}"] = _encode(
+            [[line.index, line.start, line.end, line.ja, line.zh, line.ja_with_furigana] for line in lines]
+        )
+
+    index = {}
+    offset = 0
+    for name, data in sections.items():
+        index[name] = {"offset": offset, "length": len(data), "codec": "zlib"}
+        offset += len(data)
+    if media_path:
+        index["media"] = {"offset": offset, "length": os.path.getsize(media_path), "codec": "raw"}
+
+    header = json.dumps({
+        "version": SCHEMA_VERSION,
+        "created": int(time.time()),
+        "media_suffix": os.path.splitext(media_path)[1] if media_path else None,
+        "languages": list(transcripts),
+        "sections": index,
+    }, ensure_ascii=False).encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, SCHEMA_VERSION, len(header)))
+        f.write(header)
+        for data in sections.values():
+            f.write(data)
+        if media_path:
+            with open(media_path, "rb") as media:
+                shutil.copyfileobj(media, f, 1024 * 1024)
+
+
+class LessonPackage:
+    """以内存映射方式打开的课程包，各数据段按需解压；用完后调用 close() 或使用 with 语句"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, header_len = _PREFIX.unpack_from(self._mm, 0)
+            if magic != MAGIC:
+                raise ValueError(f"不是有效的课程包文件: {path}")
+            if version > SCHEMA_VERSION:
+                raise ValueError(f"课程包格式版本 {version} 高于当前支持的版本 {SCHEMA_VERSION}，请升级程序")
+            header_end = _PREFIX.size + header_len
+            self.header = json.loads(self._mm[_PREFIX.size:header_end].decode("utf-8"))
+        except Exception:
+            self.close()
+            raise
+        self.version = version
+        self._data_start = header_end
+
+    @property
+    def languages(self):
+        return self.header["languages"]
+
+    @property
+    def media_suffix(self):
+        return self.header["media_suffix"]
+
+    def has_media(self):
+        return "media" in self.header["sections"]
+
+    def _section(self, name):
+        info = self.header["sections"][name]
+        start = self._data_start + info["offset"]
+        return json.loads(zlib.decompress(self._mm[start:start + info["length"]]).decode("utf-8"))
+
+    def segments(self):
+        data = self._section("segments")
+        return SegmentTable(data["starts"], data["ends"], data["texts"])
+
+    def merged_sentences(self):
+        return self._section("merged")
+
+    def transcript(self, language):
+        """返回指定界面语言的字幕行，课程包中没有该语言时返回 None"""
+        if language not in self.languages:
+            return None
+        return [TranscriptLine(*row) for row in self._section(f"transcript/{language}")]
+
+    def analyses(self):
+        return {(lang, sentence): (vocab, analysis) for lang, sentence, vocab, analysis in self._section("analyses")}
+
+    def media_range(self):
+        """音视频数据在课程包文件中的 (偏移, 长度)，播放时直接按区间从文件读取，不复制数据"""
+        info = self.header["sections"]["media"]
+        return self._data_start + info["offset"], info["length"]
+
+    def extract_media(self, dest_path):
+        """将音视频数据写出到 dest_path（直接从内存映射区域复制，不经过解码）"""
+        info = self.header["sections"]["media"]
+        start = self._data_start + info["offset"]
+        with open(dest_path, "wb") as f:
+            view = memoryview(self._mm)
+            try:
+                f.write(view[start:start + info["length"]])
+            finally:
+                view.release()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
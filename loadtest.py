@@ -0,0 +1,361 @@
+# =====================
+# 多会话并发压测工具
+# =====================
+# 用 Streamlit 的 AppTest 在一个进程内模拟多个同时在线的学习者，对本地模拟的 OpenAI 服务运行 app.py，
+# 统计每类交互的延迟分位数、吞吐量，以及每个 worker 进程的 CPU 时间和内存峰值，用于评估部署规格和发现并发退化。
+#
+# 测试视频在启动 worker 之前由主进程用 ffmpeg 统一生成（每个会话一个文件），不计入任何交互耗时和 worker 的 CPU 时间。
+# 每个模拟会话依次执行：
+#   process          —— 上传后点击「开始生成」的首次渲染：流水线分段提取音频、转写、智能分句、翻译、假名标注，
+#                       以及页面 HTML
+#   click            —— 点击句子按钮进行单句分析（可多次）
+#   switch_language  —— 切换界面语言（触发该语言的翻译）
+#
+# 用法：
+#   python loadtest.py --workers 2 --sessions 8 --latency 0.3 --media-seconds 300
+# 每个 worker 是一个独立进程（相当于一个 app.py 服务进程），其中 --sessions 个会话并发执行。
+
+import os
+import re
+import sys
+import json
+import queue
+import time
+import random
+import logging
+import argparse
+import subprocess
+import resource
+import tempfile
+import threading
+import statistics
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "app.py")
+SENTENCE_LABEL = re.compile(r"\[\d+\] ")
+SAMPLE_PHRASES = [
+    "よろしくお願いします", "今日はいい天気ですね", "日本語を勉強しています", "ありがとうございました",
+    "駅まで歩いて十分です", "それでは始めましょう", "もう一度言ってください", "静かな部屋で本を読む",
+]
+
+
+# ========== 模拟 OpenAI 服务 ==========
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """按请求内容返回结构正确的 Whisper / ChatCompletion 响应，并按配置的延迟阻塞"""
+    latency = 0.0
+    segments = 10
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.path.endswith("/audio/transcriptions"):
+            payload = {
+                "text": "",
+                "segments": [
+                    {"id": i, "start": i * 3.0, "end": i * 3.0 + 2.8, "text": SAMPLE_PHRASES[i % len(SAMPLE_PHRASES)]}
+                    for i in range(self.segments)
+                ],
+            }
+        else:
+            messages = json.loads(body)["messages"]
+            payload = {
+                "id": "mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "gpt-4o-mini",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self._chat_reply(messages)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {},
+            }
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def _chat_reply(messages):
+        system, user = messages[0]["content"], messages[-1]["content"]
+        if "句子边界" in system:
+            # 智能分句：每两行合并为一句
+            lines = [line.split(". ", 1)[-1] for line in user.splitlines()[1:]]
+            merged = [a + b for a, b in zip(lines[::2], lines[1::2])] + (lines[-1:] if len(lines) % 2 else [])
+            return "\n".join(f"{i + 1}. {s}" for i, s in enumerate(merged))
+        if "参考译文" in user:
+            # 相似句子参考：已有假名标注时只请求译文
+            sentence = user.rsplit("：", 1)[-1]
+            if "输出两行" not in system:
+                return f"[mock] {sentence}"
+            return f"[mock] {sentence}\n<ruby>{sentence}<rt>もっく</rt></ruby>"
+        if "ruby" in system:
+            return f"<ruby>{user}<rt>もっく</rt></ruby>"
+        if len(user) > 200:
+            return "### mock analysis\n" + "- 文法ポイント\n" * 20
+        return f"[mock] {user}"
+
+
+def start_mock_server(latency, segments):
+    """在后台线程启动模拟服务，返回 (server, api_base)"""
+    handler = type("Handler", (MockOpenAIHandler,), {"latency": latency, "segments": segments})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+# ========== 测试视频 ==========
+def media_path(media_dir, session_id):
+    return os.path.join(media_dir, f"session-{session_id}.mp4")
+
+
+def prepare_media(media_dir, count, seconds):
+    """
+    用 ffmpeg 生成指定时长的测试视频（黑色画面 + 正弦波音频），只编码一次，
+    再为每个会话重新封装一份写入不同元数据的副本，使各会话的文件内容互不相同。
+    """
+    from moviepy.config import get_setting
+    ffmpeg = get_setting("FFMPEG_BINARY")
+    base = os.path.join(media_dir, "base.mp4")
+    subprocess.run(
+        [ffmpeg, "-v", "error",
+         "-f", "lavfi", "-i", f"color=c=black:s=160x120:r=5:d={seconds}",
+         "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+         "-shortest", "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-y", base],
+        check=True, capture_output=True
+    )
+    for session_id in range(count):
+        subprocess.run(
+            [ffmpeg, "-v", "error", "-i", base, "-c", "copy", "-metadata", f"comment=session-{session_id}",
+             "-y", media_path(media_dir, session_id)],
+            check=True, capture_output=True
+        )
+
+
+# ========== 单个模拟会话 ==========
+def run_session(session_id, args, media_dir):
+    """执行一个会话的完整交互流程，返回 [(交互类型, 耗时秒数), ...]"""
+    from streamlit.testing.v1 import AppTest
+
+    timings = []
+
+    def timed(kind, func):
+        start = time.perf_counter()
+        func()
+        timings.append((kind, time.perf_counter() - start))
+
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    at.session_state["api_key"] = "sk-loadtest"
+
+    # 相当于上传完成后点击「开始生成」
+    at.session_state["tmp_path"] = media_path(media_dir, session_id)
+    at.session_state["show_manual"] = False
+    at.session_state["processing"] = True
+
+    def check():
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    timed("process", lambda: (at.run(), check()))
+    rng = random.Random(session_id)
+    for _ in range(args.clicks):
+        # 句子按钮的标签为「[序号] 日文」
+        buttons = [b for b in at.button if SENTENCE_LABEL.match(b.label)]
+        button = rng.choice(buttons)
+        timed("click", lambda: (button.click().run(), check()))
+    languages = at.sidebar.selectbox[0].options
+    timed("switch_language", lambda: (at.sidebar.selectbox[0].set_value(rng.choice(languages[1:])).run(), check()))
+    return timings
+
+
+# ========== worker 进程 ==========
+def share_runtime():
+    """
+    AppTest 为单会话测试设计：每次运行前创建模拟 Runtime 单例，运行结束后清除。
+    多个会话并发运行时会互相清除对方的单例，这里改为整个进程共享同一个模拟 Runtime。
+    """
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: shared)
+    Runtime.exists = classmethod(lambda cls: True)
+
+
+def run_worker(worker_id, args, api_base, media_dir, results):
+    """在一个进程中并发执行 args.sessions 个会话，结果写入 results 队列"""
+    timings, errors = [], []
+    try:
+        import openai
+        import streamlit.components.v1  # noqa: F401  app.py 通过 st.components.v1 访问
+
+        os.chdir(APP_DIR)
+        sys.path.insert(0, APP_DIR)
+        openai.api_base = api_base
+        openai.api_key = "sk-loadtest"
+        share_runtime()
+        # 会话线程中直接读写 session_state 时 Streamlit 会打印无关的警告
+        logging.getLogger("streamlit.runtime.scriptrunner.script_run_context").addFilter(
+            lambda record: "missing ScriptRunContext" not in record.getMessage()
+        )
+
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            futures = [
+                pool.submit(run_session, worker_id * args.sessions + i, args, media_dir)
+                for i in range(args.sessions)
+            ]
+            for future in futures:
+                try:
+                    timings.extend(future.result())
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # worker 的子进程只有 app.py 流水线提取音频的 ffmpeg，属于应用自身的开销，一并计入
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    ffmpeg_cpu = children.ru_utime + children.ru_stime
+    results.put({
+        "worker": worker_id,
+        "timings": timings,
+        "errors": errors,
+        "cpu_seconds": usage.ru_utime + usage.ru_stime + ffmpeg_cpu,
+        "ffmpeg_cpu_seconds": ffmpeg_cpu,
+        # Linux 下 ru_maxrss 单位为 KB，macOS 为字节
+        "max_rss_mb": usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    })
+
+
+# ========== 汇总报告 ==========
+def percentile(values, pct):
+    """线性插值分位数"""
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    pos = (len(values) - 1) * pct / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def build_report(worker_results, wall_seconds, harness_cpu_seconds=0.0):
+    """汇总各 worker 的结果；harness_cpu_seconds 为压测工具生成测试视频的 CPU 时间，单独列出"""
+    by_kind = {}
+    for result in worker_results:
+        for kind, seconds in result["timings"]:
+            by_kind.setdefault(kind, []).append(seconds)
+    interactions = sum(len(v) for v in by_kind.values())
+    return {
+        "wall_seconds": wall_seconds,
+        "interactions": interactions,
+        "throughput_per_second": interactions / wall_seconds if wall_seconds else 0.0,
+        "harness_ffmpeg_cpu_seconds": harness_cpu_seconds,
+        "latency": {
+            kind: {
+                "count": len(values),
+                "mean": statistics.mean(values),
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+            for kind, values in by_kind.items()
+        },
+        "workers": [
+            {
+                "worker": r["worker"],
+                "cpu_seconds": r["cpu_seconds"],
+                "ffmpeg_cpu_seconds": r["ffmpeg_cpu_seconds"],
+                "cpu_utilization": r["cpu_seconds"] / wall_seconds if wall_seconds else 0.0,
+                "max_rss_mb": r["max_rss_mb"],
+                "errors": r["errors"],
+            }
+            for r in sorted(worker_results, key=lambda r: r["worker"])
+        ],
+    }
+
+
+def print_report(report):
+    print(f"\n总耗时 {report['wall_seconds']:.2f}s，交互 {report['interactions']} 次，"
+          f"吞吐量 {report['throughput_per_second']:.2f} 次/秒\n")
+    print(f"{'interaction':<16}{'count':>7}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)")
+    for kind in ("process", "click", "switch_language"):
+        stats = report["latency"].get(kind)
+        if stats:
+            print(f"{kind:<16}{stats['count']:>7}" + "".join(
+                f"{stats[k] * 1000:>9.0f}" for k in ("mean", "p50", "p90", "p99", "max")))
+    print(f"\n{'worker':<8}{'cpu (s)':>10}{'ffmpeg (s)':>12}{'cpu util':>10}{'max rss (MB)':>14}{'errors':>8}")
+    for w in report["workers"]:
+        print(f"{w['worker']:<8}{w['cpu_seconds']:>10.2f}{w['ffmpeg_cpu_seconds']:>12.2f}{w['cpu_utilization']:>10.0%}"
+              f"{w['max_rss_mb']:>14.1f}{len(w['errors']):>8}")
+    print(f"\n（cpu 为应用进程 CPU 时间，含其中音频提取的 ffmpeg；压测工具生成测试视频另用 CPU "
+          f"{report['harness_ffmpeg_cpu_seconds']:.2f}s，未计入）")
+    for w in report["workers"]:
+        for error in w["errors"][:3]:
+            print(f"  worker {w['worker']}: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="日语学习助手多会话并发压测")
+    parser.add_argument("--workers", type=int, default=1, help="worker 进程数（每个相当于一个 app.py 服务进程）")
+    parser.add_argument("--sessions", type=int, default=4, help="每个 worker 中并发的会话数")
+    parser.add_argument("--clicks", type=int, default=3, help="每个会话点击句子进行分析的次数")
+    parser.add_argument("--segments", type=int, default=10, help="模拟每次转写（每段音频）返回的分段数")
+    parser.add_argument("--media-seconds", type=float, default=120, help="每个会话上传的测试视频时长（秒）")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟 OpenAI 接口的平均响应延迟（秒）")
+    parser.add_argument("--timeout", type=float, default=600, help="单次页面运行的超时时间（秒）")
+    parser.add_argument("--json", metavar="PATH", help="同时将报告写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    media_tmp = tempfile.TemporaryDirectory(prefix="nihonggo-loadtest-")
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    prepare_media(media_tmp.name, args.workers * args.sessions, args.media_seconds)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    harness_cpu = (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime)
+
+    server, api_base = start_mock_server(args.latency, args.segments)
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    start = time.perf_counter()
+    workers = [ctx.Process(target=run_worker, args=(i, args, api_base, media_tmp.name, results)) for i in range(args.workers)]
+    for w in workers:
+        w.start()
+    worker_results = []
+    while len(worker_results) < len(workers):
+        try:
+            worker_results.append(results.get(timeout=1))
+        except queue.Empty:
+            # worker 进程异常退出时不再等待
+            if not any(w.is_alive() for w in workers):
+                break
+    for w in workers:
+        w.join()
+    wall_seconds = time.perf_counter() - start
+    server.shutdown()
+    media_tmp.cleanup()
+
+    if len(worker_results) < len(workers):
+        print(f"{len(workers) - len(worker_results)} 个 worker 进程异常退出", file=sys.stderr)
+    report = build_report(worker_results, wall_seconds, harness_cpu)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if any(w["errors"] for w in report["workers"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
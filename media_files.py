@@ -0,0 +1,91 @@
+# =====================
+# 音视频文件服务
+# =====================
+# Streamlit 1.32 的媒体文件服务（MemoryMediaFileStorage）注册文件时会把整个文件读入进程内存并计算哈希，
+# 而会话对文件的引用在每次运行后都会被清空，所以每次交互都要重新读一遍、算一遍，
+# 会话引用期间还一直在内存中保留整个文件的副本。
+# 这里让媒体文件服务直接从磁盘读取：
+#   - 注册时只记录 (路径, 偏移, 长度)，文件 ID 由路径、大小、修改时间和区间计算，不读取文件内容；
+#   - 浏览器的 Range 请求由 FileSlice 按块从磁盘读出，内存中不保留文件副本。
+# 文件引用仍由 MediaFileManager 按会话管理，会话不再引用时自动移除。
+
+import os
+import hashlib
+
+from streamlit import runtime
+from streamlit.runtime.memory_media_file_storage import MemoryFile, get_extension_for_mimetype
+from streamlit.web.server.media_file_handler import MediaFileHandler
+
+# 每次从磁盘读取的块大小
+READ_SIZE = 256 * 1024
+
+
+class FileSlice:
+    """
+    磁盘文件中一段字节的只读视图，可代替 bytes 放入媒体文件存储。
+    len() 为字节数；切片和迭代返回按块读取的生成器（tornado 逐块写出响应）。
+    """
+    __slots__ = ("path", "offset", "length", "mtime_ns")
+
+    def __init__(self, path, offset=0, length=None):
+        stat = os.stat(path)
+        self.path = path
+        self.offset = offset
+        self.length = stat.st_size - offset if length is None else length
+        self.mtime_ns = stat.st_mtime_ns
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return self._read(0, self.length)
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(self.length)
+        return self._read(start, stop)
+
+    def _read(self, start, stop):
+        with open(self.path, "rb") as f:
+            f.seek(self.offset + start)
+            remaining = stop - start
+            while remaining > 0:
+                chunk = f.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    def file_id(self, mimetype):
+        key = f"{self.path}\0{self.offset}\0{self.length}\0{self.mtime_ns}\0{mimetype}"
+        return hashlib.sha224(key.encode("utf-8")).hexdigest()
+
+
+def _install(storage):
+    """让媒体文件存储接受 FileSlice（每个进程只替换一次 load_and_get_id）"""
+    if getattr(storage, "_accepts_file_slices", False):
+        return
+    load_and_get_id = storage.load_and_get_id
+
+    def load_file_slice(path_or_data, mimetype, kind, filename=None):
+        if not isinstance(path_or_data, FileSlice):
+            return load_and_get_id(path_or_data, mimetype, kind, filename)
+        file_id = path_or_data.file_id(mimetype)
+        if file_id not in storage._files_by_id:
+            storage._files_by_id[file_id] = MemoryFile(path_or_data, mimetype, kind, filename)
+            # tornado 首次请求时会读完整个文件计算 ETag，这里直接用文件 ID 作为版本号
+            with MediaFileHandler._lock:
+                MediaFileHandler._static_hashes[file_id + get_extension_for_mimetype(mimetype)] = file_id
+        return file_id
+
+    storage.load_and_get_id = load_file_slice
+    storage._accepts_file_slices = True
+
+
+def media_url(path, mimetype, coordinates, offset=0, length=None):
+    """
+    注册磁盘上的音视频文件（或文件中 offset 起 length 字节的一段），返回播放地址。
+    每次运行都需要调用（会话引用在运行结束后清空），开销只有一次 stat。
+    """
+    manager = runtime.get_instance().media_file_mgr
+    _install(manager._storage)
+    return manager.add(FileSlice(path, offset, length), mimetype, coordinates)
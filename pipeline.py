@@ -0,0 +1,283 @@
+# =====================
+# 流式处理流水线
+# =====================
+# 将「音频提取 → Whisper 转写 → 智能分句 → 翻译与假名标注」四个阶段改为并行的生产者-消费者流水线：
+#   - 提取阶段用 ffmpeg 按时间切分音频（相邻两段有少量重叠，避免在切分点截断词语），每切好一段就交给转写阶段；
+#   - 转写阶段逐段调用 Whisper，时间戳加上分段起点、去掉重叠部分的重复分段后交给分句阶段；
+#   - 分句阶段每积累一批分段就调用一次合并，最后一句可能未说完，留到下一批再合并；
+#   - 每个确定的句子立即交给多个翻译线程。
+# 阶段之间使用有界队列，下游处理不过来时上游自动阻塞（背压）。
+# 本模块不调用任何 Streamlit 接口，各阶段的具体处理由调用方以函数形式传入。
+
+import os
+import math
+import queue
+import shutil
+import bisect
+import tempfile
+import threading
+import subprocess
+
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+# 每段音频的时长（秒）、相邻两段的重叠时长（秒）、每次合并的最少分段数、翻译线程数，可通过 .env 配置
+CHUNK_SECONDS = float(os.getenv("PIPELINE_CHUNK_SECONDS", "30"))
+CHUNK_OVERLAP_SECONDS = float(os.getenv("PIPELINE_CHUNK_OVERLAP_SECONDS", "2"))
+MERGE_BATCH = int(os.getenv("PIPELINE_MERGE_BATCH", "12"))
+TRANSLATE_WORKERS = int(os.getenv("PIPELINE_TRANSLATE_WORKERS", "4"))
+
+# 队列结束标记
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """流水线已停止（出错或调用方不再读取结果）"""
+
+
+def _text_len(text):
+    return len("".join(text.split()))
+
+
+def align_sentences(raw_texts, sentences):
+    """
+    按字符累计长度把合并后的句子对应回原始分段。
+    返回每句对应的 (首段下标, 末段下标)；大模型对文字的细微改动按总长度比例摊平。
+    """
+    n = len(raw_texts)
+    raw_ends = []
+    total = 0
+    for text in raw_texts:
+        total += _text_len(text)
+        raw_ends.append(total)
+    sentence_total = sum(_text_len(s) for s in sentences) or 1
+    scale = total / sentence_total
+
+    ranges = []
+    first = 0
+    acc = 0
+    for k, sentence in enumerate(sentences):
+        acc += _text_len(sentence)
+        first = min(first, n - 1)
+        if k == len(sentences) - 1:
+            last = n - 1
+        else:
+            target = acc * scale
+            last = bisect.bisect_left(raw_ends, target)
+            if last > 0 and (last >= n or target - raw_ends[last - 1] < raw_ends[last] - target):
+                last -= 1
+            last = max(first, min(last, n - 1))
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+class StreamingPipeline:
+    """
+    流式处理一个音视频文件。
+    transcribe(音频路径) -> Whisper segments 列表；merge(文本列表) -> 合并后的句子列表；
+    translate(日文) -> (译文, 带假名的日文)。
+    迭代 run() 按句子顺序得到 (序号, 开始秒数, 结束秒数, 日文, 译文, 带假名的日文)。
+    """
+
+    def __init__(self, media_path, transcribe, merge, translate,
+                 chunk_seconds=CHUNK_SECONDS, chunk_overlap=CHUNK_OVERLAP_SECONDS,
+                 merge_batch=MERGE_BATCH, translate_workers=TRANSLATE_WORKERS):
+        self.media_path = media_path
+        self.transcribe = transcribe
+        self.merge = merge
+        self.translate = translate
+        self.chunk_seconds = chunk_seconds
+        self.chunk_overlap = chunk_overlap
+        self.merge_batch = merge_batch
+        self.translate_workers = translate_workers
+        # 处理结果：全部分段 (开始, 结束, 文本) 和合并后的句子
+        self.segments = []
+        self.sentences = []
+        # 不影响继续处理的问题（如某一批合并失败时退回原始分句）
+        self.warnings = []
+
+        self._stop = threading.Event()
+        self._error = None
+        self._audio_q = queue.Queue(maxsize=2)
+        self._segment_q = queue.Queue(maxsize=4)
+        self._sentence_q = queue.Queue(maxsize=translate_workers * 2)
+        self._result_q = queue.Queue(maxsize=translate_workers * 4)
+        self._chunk_dir = None
+
+    # ---------- 队列工具 ----------
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _Stopped()
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise _Stopped()
+
+    def _stage(self, target):
+        """运行一个阶段，出错时记录第一个异常并停止整条流水线"""
+        def runner():
+            try:
+                target()
+            except _Stopped:
+                pass
+            except Exception as e:
+                if self._error is None:
+                    self._error = e
+                self._stop.set()
+        return threading.Thread(target=runner, daemon=True)
+
+    # ---------- 各阶段 ----------
+    def _extract(self):
+        """
+        每隔 chunk_seconds 切出一段音频（单声道 16kHz mp3），末尾多截 chunk_overlap 秒，切好一段就放入队列。
+        每段只负责开始于 [起点, 起点 + chunk_seconds) 的分段，重叠部分留给下一段。
+        """
+        ffmpeg = get_setting("FFMPEG_BINARY")
+        duration = ffmpeg_parse_infos(self.media_path)["duration"]
+        start = 0.0
+        while start < duration:
+            length = min(self.chunk_seconds + self.chunk_overlap, duration - start)
+            owned_end = start + self.chunk_seconds if start + self.chunk_seconds < duration else math.inf
+            chunk_path = os.path.join(self._chunk_dir, f"{start:010.3f}.mp3")
+            subprocess.run(
+                [ffmpeg, "-v", "error", "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", self.media_path,
+                 "-vn", "-ac", "1", "-ar", "16000", "-b:a", "64k", "-y", chunk_path],
+                check=True, capture_output=True
+            )
+            self._put(self._audio_q, (start, owned_end, chunk_path))
+            start += self.chunk_seconds
+        self._put(self._audio_q, _DONE)
+
+    @staticmethod
+    def _chunk_segments(segments, offset, owned_end, last_end):
+        """
+        把一段音频的 Whisper 分段换算为整个文件中的时间 [(开始, 结束, 文本), ...]。
+        中点落在上一段已保留分段之内的（重叠部分的重复）和开始于 owned_end 之后的（由下一段负责）都丢弃。
+        """
+        batch = []
+        for seg in segments:
+            text = seg["text"].strip()
+            start, end = seg["start"] + offset, seg["end"] + offset
+            if not text or start >= owned_end or (start + end) / 2 < last_end:
+                continue
+            batch.append((start, end, text))
+        return batch
+
+    def _transcribe(self):
+        """逐段转写，时间戳换算为整个文件中的时间，去掉重叠部分的重复分段"""
+        last_end = 0.0
+        while True:
+            item = self._get(self._audio_q)
+            if item is _DONE:
+                break
+            offset, owned_end, chunk_path = item
+            try:
+                segments = self.transcribe(chunk_path)
+            finally:
+                os.unlink(chunk_path)
+            batch = self._chunk_segments(segments, offset, owned_end, last_end)
+            self.segments.extend(batch)
+            if batch:
+                last_end = max(last_end, batch[-1][1])
+                self._put(self._segment_q, batch)
+        self._put(self._segment_q, _DONE)
+
+    def _merge_batch(self, buffer, done):
+        """
+        合并一批分段 [(开始, 结束, 文本), ...]，返回 (确定的句子 [(开始, 结束, 句子), ...], 留到下一批的分段)。
+        未结束时最后一句可能跨越到下一段音频，连同它对应的分段一起留下，与后续分段重新合并。
+        """
+        texts = [text for _, _, text in buffer]
+        try:
+            sentences = self.merge(texts) or texts
+        except Exception as e:
+            self.warnings.append(str(e))
+            sentences = texts
+        # 缓冲过长时不再等待，避免一直无法输出
+        hold = 0 if done or len(buffer) >= self.merge_batch * 3 else 1
+        if len(sentences) <= hold:
+            return [], buffer
+        ranges = align_sentences(texts, sentences)
+        final = len(sentences) - hold
+        finished = [(buffer[first][0], buffer[last][1], sentence) for sentence, (first, last) in zip(sentences[:final], ranges[:final])]
+        if not hold:
+            return finished, []
+        held_first = ranges[final][0]
+        if held_first > ranges[final - 1][1]:
+            return finished, buffer[held_first:]
+        # 留下的句子与上一句对齐到了同一个分段（如大模型拆开了最后一段），该分段已归上一句，只保留句子本身
+        return finished, [(buffer[-1][0], buffer[-1][1], sentences[final])]
+
+    def _merge(self):
+        """分批合并分句；未结束时保留最后一句，等待后续分段"""
+        buffer = []
+        index = 0
+        done = False
+        while not done:
+            item = self._get(self._segment_q)
+            if item is _DONE:
+                done = True
+            else:
+                buffer.extend(item)
+            if not buffer or (not done and len(buffer) < self.merge_batch):
+                continue
+            finished, buffer = self._merge_batch(buffer, done)
+            for start, end, sentence in finished:
+                index += 1
+                self.sentences.append(sentence)
+                self._put(self._sentence_q, (index, start, end, sentence))
+        for _ in range(self.translate_workers):
+            self._put(self._sentence_q, _DONE)
+
+    def _translate(self):
+        """翻译并标注假名（多个线程并行）"""
+        while True:
+            item = self._get(self._sentence_q)
+            if item is _DONE:
+                break
+            index, start, end, ja = item
+            zh, ja_with_furigana = self.translate(ja)
+            self._put(self._result_q, (index, start, end, ja, zh, ja_with_furigana))
+        self._put(self._result_q, _DONE)
+
+    # ---------- 运行 ----------
+    def run(self):
+        """启动流水线，按句子序号依次产出结果；任一阶段出错时抛出该异常"""
+        self._chunk_dir = tempfile.mkdtemp(prefix="nihonggo-chunks-")
+        stages = [self._extract, self._transcribe, self._merge] + [self._translate] * self.translate_workers
+        for thread in [self._stage(stage) for stage in stages]:
+            thread.start()
+        pending = {}
+        next_index = 1
+        finished = 0
+        try:
+            while finished < self.translate_workers:
+                try:
+                    item = self._result_q.get(timeout=0.1)
+                except queue.Empty:
+                    if self._error is not None:
+                        raise self._error
+                    continue
+                if item is _DONE:
+                    finished += 1
+                    continue
+                # 翻译线程完成顺序不定，按序号重新排序后输出
+                pending[item[0]] = item
+                while next_index in pending:
+                    yield pending.pop(next_index)
+                    next_index += 1
+            if self._error is not None:
+                raise self._error
+        finally:
+            self._stop.set()
+            shutil.rmtree(self._chunk_dir, ignore_errors=True)
@@ -0,0 +1,218 @@
+// =====================
+// 字幕播放器脚本
+// =====================
+// 由 app.py 嵌入单句朗读模块的页面中；player_bench.html 也直接加载本文件做性能测试。
+// - cue → 句子序号的映射在字幕加载后一次性建立，cuechange 时 O(1) 查找；
+// - 高亮/循环状态切换只修改前后两行的 class，不再遍历所有字幕行；
+// - 单句循环的边界检测由 requestVideoFrameCallback 和 timeupdate 事件驱动，不再使用 setInterval 轮询；
+//   纯音频（或浏览器不支持逐帧回调）时按剩余时长设置一次性定时器，在 seeked/play/ratechange 时重新计算。
+
+// 将 00:00:00.000 格式的时间戳转换为秒数
+function parseTimestamp(timestamp) {
+  const [time, ms] = timestamp.split('.');
+  const [hours, minutes, seconds] = time.split(':');
+  return parseFloat(hours) * 3600 + parseFloat(minutes) * 60 + parseFloat(seconds) + parseFloat('0.' + ms);
+}
+
+// 初始化播放器，返回供外部（性能测试页）调用的接口
+function initTranscriptPlayer(video, transcriptSection) {
+  // 句子序号 → 字幕行元素
+  const rows = new Map();
+  for (const el of transcriptSection.querySelectorAll('.transcript-line')) {
+    rows.set(Number(el.dataset.index), el);
+  }
+  // cue 对象 → 句子序号
+  const cueToIndex = new Map();
+  const hasFrameCallback = 'requestVideoFrameCallback' in HTMLVideoElement.prototype;
+
+  let highlightedRow = null;
+  let loopingRow = null;
+  let loopStart = 0;
+  let loopEnd = 0;
+  let frameHandle = null;
+  let loopTimer = null;
+  let isManualHighlight = false;
+  let manualTimer = null;
+
+  function buildCueIndex(track) {
+    cueToIndex.clear();
+    const cues = track.cues || [];
+    for (let i = 0; i < cues.length; i++) {
+      cueToIndex.set(cues[i], i + 1);
+    }
+  }
+
+  function indexOfCue(track, cue) {
+    let idx = cueToIndex.get(cue);
+    if (idx === undefined) {
+      // 字幕可能在 loadedmetadata 之后才加载完成，首次遇到未知 cue 时重建映射
+      buildCueIndex(track);
+      idx = cueToIndex.get(cue);
+    }
+    return idx;
+  }
+
+  // 高亮指定句子，只修改上一个高亮行和新高亮行
+  function highlightSentence(index) {
+    const el = rows.get(index) || null;
+    if (el === highlightedRow) return;
+    if (highlightedRow) highlightedRow.classList.remove('highlight');
+    if (el) {
+      el.classList.add('highlight');
+      el.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+    }
+    highlightedRow = el;
+  }
+
+  function onCueChange(track, cue) {
+    // 只有在没有手动高亮且没有循环播放时才自动更新高亮
+    if (!cue || isManualHighlight || loopingRow) return;
+    const idx = indexOfCue(track, cue);
+    if (idx !== undefined) highlightSentence(idx);
+  }
+
+  // 到达循环终点时跳回起点
+  function checkLoopBoundary(time) {
+    if (loopingRow && time >= loopEnd) {
+      video.currentTime = loopStart;
+    }
+  }
+
+  function onVideoFrame(now, metadata) {
+    frameHandle = null;
+    if (!loopingRow) return;
+    checkLoopBoundary(metadata.mediaTime);
+    frameHandle = video.requestVideoFrameCallback(onVideoFrame);
+  }
+
+  // 是否可以逐帧检测：需要浏览器支持且媒体中有视频轨道
+  function usesFrameCallback() {
+    return hasFrameCallback && video.videoWidth > 0;
+  }
+
+  // 按到达循环终点的剩余时长设置定时器（纯音频时使用）
+  function armLoopTimer() {
+    clearTimeout(loopTimer);
+    loopTimer = null;
+    if (!loopingRow || usesFrameCallback() || video.paused) return;
+    const remaining = (loopEnd - video.currentTime) / (video.playbackRate || 1);
+    loopTimer = setTimeout(onLoopTimer, Math.max(0, remaining * 1000));
+  }
+
+  function onLoopTimer() {
+    loopTimer = null;
+    if (!loopingRow) return;
+    if (video.currentTime >= loopEnd - 0.01) {
+      // 跳转完成后由 seeked 事件重新设置定时器
+      video.currentTime = loopStart;
+    } else {
+      // 播放卡顿等原因导致定时器提前触发，重新计算
+      armLoopTimer();
+    }
+  }
+
+  function stopLoop() {
+    if (frameHandle !== null) {
+      video.cancelVideoFrameCallback(frameHandle);
+      frameHandle = null;
+    }
+    clearTimeout(loopTimer);
+    loopTimer = null;
+    if (loopingRow) {
+      loopingRow.classList.remove('looping');
+      loopingRow = null;
+    }
+  }
+
+  function handleSentenceClick(el) {
+    const index = Number(el.dataset.index);
+    // 发送消息到 Streamlit
+    window.parent.postMessage({
+      type: 'sentence_click',
+      data: {
+        index: index,
+        timestamp: el.dataset.start,
+        sentence: el.dataset.ja
+      }
+    }, '*');
+
+    // 跳转到视频时间点并高亮
+    video.currentTime = parseTimestamp(el.dataset.start);
+    highlightSentence(index);
+    isManualHighlight = true;
+
+    // 视频开始播放后重置手动高亮状态
+    clearTimeout(manualTimer);
+    manualTimer = setTimeout(() => {
+      isManualHighlight = false;
+    }, 1000);
+  }
+
+  function handleLoopPlay(el) {
+    stopLoop();
+    loopStart = parseTimestamp(el.dataset.start);
+    loopEnd = parseTimestamp(el.dataset.end);
+    video.currentTime = loopStart;
+    video.play();
+
+    highlightSentence(Number(el.dataset.index));
+    el.classList.add('looping');
+    loopingRow = el;
+    if (usesFrameCallback()) {
+      frameHandle = video.requestVideoFrameCallback(onVideoFrame);
+    } else {
+      // 纯音频没有视频帧回调，timeupdate 间隔可达 250ms，改用按剩余时长设置的定时器
+      armLoopTimer();
+    }
+  }
+
+  function handleCancelLoop() {
+    stopLoop();
+    // 继续播放视频
+    video.play();
+  }
+
+  // 所有字幕行共用一个点击监听
+  transcriptSection.addEventListener('click', (event) => {
+    const el = event.target.closest('.transcript-line');
+    if (!el) return;
+    const button = event.target.closest('button');
+    if (button && button.dataset.action === 'loop') {
+      handleLoopPlay(el);
+    } else if (button && button.dataset.action === 'cancel-loop') {
+      handleCancelLoop();
+    } else if (!button) {
+      handleSentenceClick(el);
+    }
+  });
+
+  video.addEventListener('timeupdate', () => {
+    checkLoopBoundary(video.currentTime);
+  });
+
+  video.addEventListener('loadedmetadata', () => {
+    const track = video.textTracks[0];
+    if (!track) return;
+    track.mode = 'hidden';  // 隐藏渲染但保留 cue 事件
+    buildCueIndex(track);
+    track.addEventListener('cuechange', () => {
+      onCueChange(track, track.activeCues[0]);
+    });
+  });
+
+  video.addEventListener('play', () => {
+    // 开始播放时重置手动高亮状态
+    isManualHighlight = false;
+    armLoopTimer();
+  });
+
+  video.addEventListener('seeked', armLoopTimer);
+  video.addEventListener('ratechange', armLoopTimer);
+
+  video.addEventListener('pause', () => {
+    // 暂停时取消循环播放
+    stopLoop();
+  });
+
+  return { onCueChange, highlightSentence, buildCueIndex };
+}
@@ -0,0 +1,239 @@
+# =====================
+# 会话状态内存管理
+# =====================
+# 提供紧凑的转写记录结构、会话内存占用统计，以及大对象溢出到磁盘（spill-to-disk）的策略。
+# 注意：Streamlit 每次交互都会重新执行 app.py，其中定义的类每次都会被重新创建，
+# 因此需要跨次运行保存在 session_state 中的类型统一放在本模块里定义。
+
+import os
+import sys
+import mmap
+import uuid
+import time
+import pickle
+import shutil
+import tempfile
+from array import array
+
+# 单个会话条目超过该阈值（MB）时移出内存，写入磁盘；可通过 .env 配置
+SPILL_THRESHOLD_MB = float(os.getenv("SESSION_SPILL_THRESHOLD_MB", "8"))
+# 会话文件（溢出文件、上传的音视频、课程包等）存放目录，每个会话一个子目录
+SPILL_DIR = os.path.join(tempfile.gettempdir(), "nihonggo_spill")
+# 会话目录超过该时长（小时）未被访问即视为会话已结束，整个目录会被删除；可通过 .env 配置
+SESSION_FILE_TTL_HOURS = float(os.getenv("SESSION_FILE_TTL_HOURS", "24"))
+# 两次清理之间的最短间隔（秒）
+_SWEEP_INTERVAL = 600
+_last_sweep = 0.0
+
+
+# ========== 紧凑的转写记录结构 ==========
+class SegmentTable:
+    """
+    Whisper 分段的紧凑表示。
+    原始 verbose_json 中每段都是包含 tokens、avg_logprob 等十余个字段的 dict，
+    这里只保留起止时间（array('d') 连续存储）和去除首尾空白的文本。
+    """
+    __slots__ = ("starts", "ends", "texts")
+
+    def __init__(self, starts=(), ends=(), texts=()):
+        self.starts = array("d", starts)
+        self.ends = array("d", ends)
+        self.texts = list(texts)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """由 [(开始, 结束, 文本), ...] 构造（流式流水线的 segments）"""
+        return cls(
+            (row[0] for row in rows),
+            (row[1] for row in rows),
+            (row[2] for row in rows),
+        )
+
+    def __len__(self):
+        return len(self.texts)
+
+
+class TranscriptLine:
+    """单句字幕行：序号、起止时间戳、日文原文、译文、带假名的日文"""
+    __slots__ = ("index", "start", "end", "ja", "zh", "ja_with_furigana")
+
+    def __init__(self, index, start, end, ja, zh, ja_with_furigana):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.ja = ja
+        self.zh = zh
+        self.ja_with_furigana = ja_with_furigana
+
+
+class SpilledArtifact:
+    """已溢出到磁盘的会话条目句柄，只在内存中保留文件路径和大小"""
+    __slots__ = ("path", "nbytes")
+
+    def __init__(self, path, nbytes):
+        self.path = path
+        self.nbytes = nbytes
+
+
+# ========== 内存占用统计 ==========
+def estimate_size(obj, _seen=None):
+    """
+    递归估算对象的内存占用（字节）。
+    sys.getsizeof 只统计对象本身，这里会继续统计容器元素、__slots__ 和 __dict__ 中的属性，
+    同一对象只计算一次。
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, array)):
+        return size
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += estimate_size(k, _seen) + estimate_size(v, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, _seen)
+    else:
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(obj, name):
+                    size += estimate_size(getattr(obj, name), _seen)
+        if hasattr(obj, "__dict__"):
+            size += estimate_size(obj.__dict__, _seen)
+    return size
+
+
+def session_footprint(state, files=None):
+    """
+    统计会话中每个条目的内存占用和磁盘占用。
+    files 为会话引用的磁盘文件 {名称: 路径}（如音视频），只计入磁盘占用，路径为空或文件不存在时跳过。
+    返回 [(键名, 内存字节数, 磁盘字节数), ...]，按内存占用从大到小排序。
+    """
+    rows = []
+    for key in list(state.keys()):
+        value = state[key]
+        on_disk = value.nbytes if isinstance(value, SpilledArtifact) else 0
+        rows.append((str(key), estimate_size(value), on_disk))
+    for name, path in (files or {}).items():
+        if path and os.path.exists(path):
+            rows.append((f"{name} (file)", 0, os.path.getsize(path)))
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return rows
+
+
+# ========== 会话文件目录 ==========
+def sweep(ttl_hours=None):
+    """
+    删除超过保留时长未被访问的会话目录。
+    Streamlit 不会通知会话结束，已结束会话留下的文件只能按最后访问时间清理。
+    """
+    global _last_sweep
+    if ttl_hours is None:
+        ttl_hours = SESSION_FILE_TTL_HOURS
+    _last_sweep = time.time()
+    deadline = _last_sweep - ttl_hours * 3600
+    try:
+        names = os.listdir(SPILL_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(SPILL_DIR, name)
+        try:
+            if os.path.getmtime(path) >= deadline:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def session_dir(state):
+    """
+    返回当前会话专用的文件目录（不存在时创建），并刷新其修改时间，表示会话仍在使用。
+    进程启动后的第一次调用以及之后每隔 _SWEEP_INTERVAL 秒会顺带清理过期的会话目录。
+    """
+    if time.time() - _last_sweep > _SWEEP_INTERVAL:
+        sweep()
+    if "session_dir" not in state:
+        state["session_dir"] = os.path.join(SPILL_DIR, uuid.uuid4().hex)
+    path = state["session_dir"]
+    os.makedirs(path, exist_ok=True)
+    os.utime(path)
+    return path
+
+
+def remove_file(path):
+    """删除不再使用的会话文件"""
+    if path:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+# ========== 溢出到磁盘 ==========
+def spill(value, directory=SPILL_DIR):
+    """将对象序列化写入 directory 目录，返回 SpilledArtifact 句柄"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.pkl")
+    with open(path, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return SpilledArtifact(path, os.path.getsize(path))
+
+
+def restore(value):
+    """若为 SpilledArtifact 则通过内存映射从磁盘读回对象，否则原样返回"""
+    if not isinstance(value, SpilledArtifact):
+        return value
+    with open(value.path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return pickle.loads(mm)
+
+
+def release(value):
+    """删除 SpilledArtifact 对应的磁盘文件"""
+    if isinstance(value, SpilledArtifact):
+        remove_file(value.path)
+
+
+def store(state, key, value, threshold_mb=None):
+    """
+    写入会话条目：超过阈值的对象溢出到磁盘，会话中只保留句柄。
+    覆盖旧值时会同时清理旧的溢出文件。
+    """
+    if threshold_mb is None:
+        threshold_mb = SPILL_THRESHOLD_MB
+    if key in state:
+        release(state[key])
+    if value is not None and estimate_size(value) > threshold_mb * 1024 * 1024:
+        value = spill(value, session_dir(state))
+    state[key] = value
+
+
+def discard_missing(state):
+    """把溢出文件已被清理的条目置为 None（会话目录过期后页面再次被操作时调用），返回被丢弃的键"""
+    missing = [key for key in list(state.keys())
+               if isinstance(state[key], SpilledArtifact) and not os.path.exists(state[key].path)]
+    for key in missing:
+        state[key] = None
+    return missing
+
+
+def load(state, key, default=None):
+    """
+    读取会话条目，已溢出的条目会从磁盘读回（不会重新放回会话内存）。
+    溢出文件已被清理时（会话长时间未操作，会话目录过期）把该条目置为 None 并返回 default。
+    """
+    if key not in state:
+        return default
+    try:
+        return restore(state[key])
+    except FileNotFoundError:
+        state[key] = None
+        return default
+
@@ -0,0 +1,61 @@
+import pytest
+
+from jmdict_index import DictionaryIndex, main
+
+JMDICT_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<JMdict>
+<entry>
+<k_ele><keb>箸</keb></k_ele>
+<r_ele><reb>はし</reb></r_ele>
+<sense><pos>noun</pos><gloss>chopsticks</gloss></sense>
+</entry>
+<entry>
+<k_ele><keb>橋</keb></k_ele>
+<r_ele><reb>はし</reb></r_ele>
+<sense><gloss>bridge</gloss></sense>
+</entry>
+<entry>
+<k_ele><keb>日本</keb></k_ele>
+<k_ele><keb>日夲</keb></k_ele>
+<r_ele><reb>にほん</reb><re_restr>日本</re_restr></r_ele>
+<r_ele><reb>にっぽん</reb></r_ele>
+<r_ele><reb>ニホン</reb><re_nokanji/></r_ele>
+<sense><gloss>Japan</gloss><gloss xml:lang="ger">Japan</gloss></sense>
+</entry>
+</JMdict>
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    xml = tmp_path / "JMdict_e.xml"
+    xml.write_text(JMDICT_XML, encoding="utf-8")
+    zh = tmp_path / "ja_zh.tsv"
+    zh.write_text("はし\t桥\n箸\t筷子\n橋\t桥梁\n未収録\t无\n", encoding="utf-8")
+    out = tmp_path / "jmdict.idx"
+    main([str(xml), "-o", str(out), "--gloss", f"zh={zh}"])
+    index = DictionaryIndex(str(out))
+    yield index
+    index.close()
+
+
+def test_lookup_compiled_entries(index):
+    assert len(index) == 8
+    entry = index.lookup("箸")
+    assert (entry.reading, entry.glosses["en"]) == ("はし", "chopsticks")
+    assert index.lookup("橋").glosses["en"] == "bridge"
+    assert index.lookup("未収録") is None
+
+
+def test_supplementary_glosses_apply_to_their_own_key(index):
+    assert index.lookup("箸").glosses["zh"] == "筷子"
+    assert index.lookup("橋").glosses["zh"] == "桥梁"
+    assert index.lookup("はし").glosses["zh"] == "桥"
+    assert index.lookup("日本").glosses["zh"] == ""
+
+
+def test_readings_follow_restrictions(index):
+    assert index.lookup("日本").reading == "にほん"
+    assert index.lookup("日夲").reading == "にっぽん"
+    assert index.lookup("にっぽん").reading == "にっぽん"
+    assert index.lookup("ニホン").reading == "ニホン"
@@ -0,0 +1,77 @@
+import struct
+
+import pytest
+
+import lesson_package
+from lesson_package import LessonPackage, write_lesson
+from session_store import SegmentTable, TranscriptLine
+
+
+@pytest.fixture
+def lesson(tmp_path):
+    media = tmp_path / "media.mp4"
+    media.write_bytes(b"\x00\x01media-bytes" * 100)
+    path = tmp_path / "lesson.nhlesson"
+    write_lesson(
+        str(path),
+        SegmentTable([0.0, 1.5], [1.5, 3.0], ["今日は", "いい天気ですね"]),
+        ["今日はいい天気ですね"],
+        {"中文": [TranscriptLine(1, "00:00:00.000", "00:00:03.000", "今日はいい天気ですね", "今天天气真好", "<ruby>今日<rt>きょう</rt></ruby>はいい<ruby>天気<rt>てんき</rt></ruby>ですね")]},
+        analyses={("中文", "今日はいい天気ですね"): ("| 词 |", "分析")},
+        media_path=str(media),
+    )
+    return path, media
+
+
+def test_round_trip_sections(lesson):
+    path, media = lesson
+    with LessonPackage(str(path)) as package:
+        assert package.version == lesson_package.SCHEMA_VERSION
+        assert package.languages == ["中文"]
+        segments = package.segments()
+        assert list(segments.starts) == [0.0, 1.5]
+        assert list(segments.ends) == [1.5, 3.0]
+        assert segments.texts == ["今日は", "いい天気ですね"]
+        assert package.merged_sentences() == ["今日はいい天気ですね"]
+        line, = package.transcript("中文")
+        assert (line.index, line.start, line.end, line.ja, line.zh) == (
+            1, "00:00:00.000", "00:00:03.000", "今日はいい天気ですね", "今天天气真好")
+        assert package.analyses() == {("中文", "今日はいい天気ですね"): ("| 词 |", "分析")}
+        assert package.transcript("English") is None
+
+
+def test_media_range_points_at_raw_media(lesson, tmp_path):
+    path, media = lesson
+    with LessonPackage(str(path)) as package:
+        assert package.has_media() and package.media_suffix == ".mp4"
+        offset, length = package.media_range()
+        package.extract_media(str(tmp_path / "out.mp4"))
+    with open(path, "rb") as f:
+        f.seek(offset)
+        assert f.read(length) == media.read_bytes()
+    assert (tmp_path / "out.mp4").read_bytes() == media.read_bytes()
+
+
+def test_lesson_without_media(tmp_path):
+    path = tmp_path / "lesson.nhlesson"
+    write_lesson(str(path), SegmentTable(), [], {})
+    with LessonPackage(str(path)) as package:
+        assert not package.has_media()
+        assert package.media_suffix is None
+        assert package.analyses() == {}
+
+
+def test_newer_schema_version_is_rejected(lesson):
+    path, _ = lesson
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<H", data, len(lesson_package.MAGIC), lesson_package.SCHEMA_VERSION + 1)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        LessonPackage(str(path))
+
+
+def test_invalid_magic_is_rejected(tmp_path):
+    path = tmp_path / "bad.nhlesson"
+    path.write_bytes(b"NOTALESN" + b"\x00" * 16)
+    with pytest.raises(ValueError):
+        LessonPackage(str(path))
@@ -0,0 +1,98 @@
+import math
+import queue
+import threading
+
+from pipeline import StreamingPipeline, align_sentences, _DONE
+
+
+def split_merge(texts):
+    """模拟智能分句：拼接全部文本后按「。」断句，末尾未完的部分单独成句"""
+    joined = "".join(texts)
+    sentences = [s + "。" for s in joined.split("。")[:-1]]
+    tail = joined.split("。")[-1]
+    return sentences + ([tail] if tail else [])
+
+
+def make_pipeline(merge, merge_batch=12):
+    return StreamingPipeline("unused.mp4", transcribe=None, merge=merge, translate=None,
+                             merge_batch=merge_batch, translate_workers=1)
+
+
+def run_merge(pipeline, batches):
+    """把分段批次送入分句阶段，返回该阶段输出的 (序号, 开始, 结束, 句子)"""
+    pipeline._segment_q = queue.Queue()
+    pipeline._sentence_q = queue.Queue()
+    for batch in batches:
+        pipeline._segment_q.put(batch)
+    pipeline._segment_q.put(_DONE)
+    thread = threading.Thread(target=pipeline._merge)
+    thread.start()
+    thread.join(timeout=5)
+    out = []
+    while True:
+        item = pipeline._sentence_q.get_nowait()
+        if item is _DONE:
+            return out
+        out.append(item)
+
+
+def segments(texts, start=0.0):
+    return [(start + i * 2.0, start + i * 2.0 + 1.5, text) for i, text in enumerate(texts)]
+
+
+def test_align_sentences_maps_merged_sentences_to_segments():
+    assert align_sentences(["あい", "うえお", "か", "きく"], ["あいうえお", "かきく"]) == [(0, 1), (2, 3)]
+
+
+def test_align_sentences_split_segment_shares_last_segment():
+    assert align_sentences(["あいうえお"], ["あい", "うえお"]) == [(0, 0), (0, 0)]
+
+
+def test_held_sentence_on_split_final_segment_is_kept():
+    texts = [f"文{i}。" for i in range(11)] + ["たちつてと。なにぬねの"]
+    pipeline = make_pipeline(split_merge)
+    finished, rest = pipeline._merge_batch(segments(texts), done=False)
+    assert [s for _, _, s in finished][-1] == "たちつてと。"
+    assert [text for _, _, text in rest] == ["なにぬねの"]
+
+
+def test_merge_stage_keeps_all_text_across_batches():
+    first = [f"文{i}。" for i in range(11)] + ["たちつてと。なにぬねの"]
+    second = ["はひふへほ。"] + [f"次{i}。" for i in range(11)]
+    pipeline = make_pipeline(split_merge)
+    out = run_merge(pipeline, [segments(first), segments(second, start=30.0)])
+    sentences = [sentence for _, _, _, sentence in out]
+    assert "なにぬねのはひふへほ。" in sentences
+    assert "".join(sentences) == "".join(first + second)
+    assert [index for index, _, _, _ in out] == list(range(1, len(out) + 1))
+    assert pipeline.sentences == sentences
+
+
+def test_merge_failure_falls_back_to_raw_segments():
+    def failing_merge(texts):
+        raise RuntimeError("boom")
+
+    texts = [f"文{i}。" for i in range(5)]
+    pipeline = make_pipeline(failing_merge, merge_batch=3)
+    out = run_merge(pipeline, [segments(texts)])
+    assert [sentence for _, _, _, sentence in out] == texts
+    assert pipeline.warnings
+
+
+def test_chunk_segments_drops_overlap_duplicates_and_next_chunk_segments():
+    whisper = [
+        {"start": 0.0, "end": 1.5, "text": " 重複 "},
+        {"start": 1.5, "end": 4.0, "text": "続き"},
+        {"start": 30.5, "end": 31.8, "text": "次の段"},
+        {"start": 5.0, "end": 5.5, "text": "  "},
+    ]
+    # 上一段已保留到 31.5 秒：本段（从 30 秒开始）开头的「重複」是重叠部分的重复；
+    # 「次の段」开始于 60.5 秒，超出本段负责的范围，由下一段处理
+    batch = StreamingPipeline._chunk_segments(whisper, offset=30.0, owned_end=60.0, last_end=31.5)
+    assert batch == [(31.5, 34.0, "続き")]
+
+
+def test_last_chunk_keeps_trailing_segments():
+    whisper = [{"start": 0.0, "end": 1.5, "text": "最後"}, {"start": 31.0, "end": 32.0, "text": "末尾"}]
+    batch = StreamingPipeline._chunk_segments(whisper, offset=0.0, owned_end=math.inf, last_end=0.0)
+    assert batch == [(0.0, 1.5, "最後"), (31.0, 32.0, "末尾")]
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+import session_store
+from session_store import SpilledArtifact
+
+
+@pytest.fixture
+def spill_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_store, "SPILL_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_spilled_value_loads_back_and_is_released(spill_dir):
+    state = {}
+    value = [f"文{i}" for i in range(100)]
+    session_store.store(state, "lines", value, threshold_mb=0)
+    spilled = state["lines"]
+    assert isinstance(spilled, SpilledArtifact)
+    assert os.path.dirname(os.path.dirname(spilled.path)) == str(spill_dir)
+    assert session_store.load(state, "lines") == value
+    # 覆盖旧值时删除旧的溢出文件
+    session_store.store(state, "lines", None, threshold_mb=0)
+    assert state["lines"] is None
+    assert not os.path.exists(spilled.path)
+
+
+def test_entries_whose_spill_files_were_swept_are_dropped(spill_dir):
+    state = {"small": "文"}
+    session_store.store(state, "lines", ["文"], threshold_mb=0)
+    session_store.store(state, "segments", ["文"], threshold_mb=0)
+    session_store.sweep(ttl_hours=-1)
+    assert session_store.load(state, "lines", default=[]) == []
+    assert state["lines"] is None
+    assert session_store.discard_missing(state) == ["segments"]
+    assert state == {"small": "文", "lines": None, "segments": None, "session_dir": state["session_dir"]}
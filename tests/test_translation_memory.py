@@ -0,0 +1,55 @@
+from translation_memory import TranslationMemory
+
+SENTENCE = "昨日は駅の近くの静かな喫茶店で友達と一緒にコーヒーを飲みました"
+SIMILAR = "昨日は駅の近くの静かな喫茶店で友達と一緒にコーヒーを飲みましたね"
+
+
+def test_exact_fuzzy_and_miss_lookups():
+    tm = TranslationMemory()
+    tm.add("中文", SENTENCE, "昨天在车站附近的安静咖啡馆和朋友一起喝了咖啡", "<ruby>昨日<rt>きのう</rt></ruby>…")
+
+    exact = tm.lookup("中文", SENTENCE)
+    assert (exact.kind, exact.translation, exact.similarity) == ("exact", "昨天在车站附近的安静咖啡馆和朋友一起喝了咖啡", 1.0)
+    fuzzy = tm.lookup("中文", SIMILAR)
+    assert (fuzzy.kind, fuzzy.ja) == ("fuzzy", SENTENCE)
+    assert fuzzy.similarity >= tm.threshold
+    # 译文按目标语言分别存储
+    assert tm.lookup("English", SENTENCE) is None
+    assert tm.lookup("中文", "まったく関係のない文です") is None
+
+    # fuzzy 候选在调用方采用参考译文后才计为命中
+    assert tm.stats == {"lookups": 4, "exact": 1, "fuzzy": 0, "fuzzy_fallback": 0, "miss": 2}
+    tm.record("fuzzy")
+    assert tm.hit_rate() == 0.5
+
+
+def test_ruby_is_shared_across_languages():
+    tm = TranslationMemory()
+    tm.add("中文", SENTENCE, "喝了咖啡", "RUBY")
+    assert tm.ruby(SENTENCE) == "RUBY"
+    assert tm.lookup("English", SENTENCE) is None
+    tm.add("English", SENTENCE, "drank coffee", "RUBY")
+    assert tm.lookup("English", SENTENCE).kind == "exact"
+
+
+def test_eviction_removes_buckets_and_releases_ruby_after_last_reference():
+    tm = TranslationMemory(capacity=2)
+    tm.add("中文", SENTENCE, "喝了咖啡", "RUBY")
+    tm.add("English", SENTENCE, "drank coffee", "RUBY")
+    assert tm._ruby_refs[SENTENCE] == 2
+
+    # 淘汰最早写入的中文译文：假名仍被英文译文引用，保留
+    tm.add("中文", "まったく関係のない文です", "完全无关的句子", "OTHER")
+    assert len(tm) == 2
+    assert ("中文", SENTENCE) not in tm._translations
+    assert tm.ruby(SENTENCE) == "RUBY"
+    assert tm._ruby_refs[SENTENCE] == 1
+    assert tm.lookup("中文", SIMILAR) is None
+
+    # 淘汰最后一条引用后假名一并删除，桶中不再留有该句
+    tm.add("中文", "もう一つ別の文があります", "还有另一个句子", "ANOTHER")
+    assert tm.ruby(SENTENCE) is None
+    assert SENTENCE not in tm._ruby_refs
+    assert all(key[1] != SENTENCE for bucket in tm._buckets.values() for key in bucket)
+    assert all(bucket for bucket in tm._buckets.values())
+    assert set(tm._band_keys) == set(tm._translations) == set(tm._shingles)
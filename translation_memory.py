@@ -0,0 +1,164 @@
+# =====================
+# 翻译记忆（Translation Memory）
+# =====================
+# 歌曲副歌、节目开场白、「よろしくお願いします」之类的固定表达在语料中反复出现。
+# 本模块缓存已翻译句子的译文和假名标注：
+#   - 完全相同的句子直接复用译文和假名；
+#   - 相似句子（字符 n-gram 的 MinHash/LSH 索引查找）返回最接近的旧译文，作为提示交给更便宜的一次调用。
+
+import os
+import zlib
+import random
+import threading
+from collections import deque
+
+# 判定为相似句子的 Jaccard 相似度阈值，可通过 .env 配置
+SIMILARITY_THRESHOLD = float(os.getenv("TM_SIMILARITY_THRESHOLD", "0.75"))
+# 翻译记忆最多保留的句子数，超出后按写入顺序淘汰
+CAPACITY = int(os.getenv("TM_CAPACITY", "50000"))
+
+# MinHash 参数：NUM_PERM 个哈希函数，分为 BANDS 段，每段 NUM_PERM // BANDS 行
+NUM_PERM = 32
+BANDS = 8
+NGRAM = 2
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def shingles(text, n=NGRAM):
+    """将句子切分为字符 n-gram 集合（忽略空白），短于 n 的句子整体作为一个元素"""
+    text = "".join(text.split())
+    if len(text) <= n:
+        return frozenset([text])
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def minhash(grams):
+    """计算 n-gram 集合的 MinHash 签名"""
+    hashes = [zlib.crc32(g.encode("utf-8")) for g in grams]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(a, b):
+    """两个集合的 Jaccard 相似度"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class Match:
+    """查找结果：kind 为 "exact" 或 "fuzzy"，similarity 为 Jaccard 相似度"""
+    __slots__ = ("kind", "ja", "translation", "ruby", "similarity")
+
+    def __init__(self, kind, ja, translation, ruby, similarity):
+        self.kind = kind
+        self.ja = ja
+        self.translation = translation
+        self.ruby = ruby
+        self.similarity = similarity
+
+
+class TranslationMemory:
+    """
+    进程内共享的翻译记忆，线程安全。
+    译文按目标语言分别存储；假名标注只与日文原文有关，跨语言复用。
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, capacity=CAPACITY):
+        self.threshold = threshold
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._translations = {}   # (语言, 日文) -> 译文
+        self._ruby = {}           # 日文 -> 带假名的 HTML
+        self._ruby_refs = {}      # 日文 -> 引用该假名标注的译文条数
+        self._shingles = {}       # (语言, 日文) -> n-gram 集合
+        self._buckets = {}        # (语言, 段号, 段签名) -> [(语言, 日文), ...]
+        self._band_keys = {}      # (语言, 日文) -> 所在的桶键列表，用于淘汰
+        self._order = deque()     # 写入顺序
+        # fuzzy 只统计实际采用了参考译文的查找，候选未被采用时记为 fuzzy_fallback
+        self.stats = {"lookups": 0, "exact": 0, "fuzzy": 0, "fuzzy_fallback": 0, "miss": 0}
+
+    def __len__(self):
+        return len(self._translations)
+
+    def _band_keys_for(self, lang, signature):
+        rows = NUM_PERM // BANDS
+        return [(lang, band, signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+
+    def lookup(self, lang, ja):
+        """
+        查找句子：完全相同且已有该语言译文时返回 exact，
+        否则在 LSH 候选中返回相似度最高且不低于阈值的 fuzzy，都没有则返回 None。
+        fuzzy 候选是否真正命中由调用方在得到结果后通过 record() 记录。
+        """
+        key = (lang, ja)
+        with self._lock:
+            self.stats["lookups"] += 1
+            if key in self._translations and ja in self._ruby:
+                self.stats["exact"] += 1
+                return Match("exact", ja, self._translations[key], self._ruby[ja], 1.0)
+            grams = shingles(ja)
+            best, best_sim = None, self.threshold
+            seen = set()
+            for band_key in self._band_keys_for(lang, minhash(grams)):
+                for candidate in self._buckets.get(band_key, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    sim = jaccard(grams, self._shingles[candidate])
+                    if sim >= best_sim:
+                        best, best_sim = candidate, sim
+            if best is None:
+                self.stats["miss"] += 1
+                return None
+            return Match("fuzzy", best[1], self._translations[best], self._ruby.get(best[1]), best_sim)
+
+    def record(self, outcome):
+        """记录 fuzzy 候选的处理结果："fuzzy"（采用了参考译文）或 "fuzzy_fallback"（退回完整翻译）"""
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def ruby(self, ja):
+        """返回已缓存的假名标注（可能来自其他目标语言的翻译），没有则返回 None"""
+        with self._lock:
+            return self._ruby.get(ja)
+
+    def add(self, lang, ja, translation, ruby):
+        """写入一句译文和假名标注"""
+        key = (lang, ja)
+        with self._lock:
+            self._ruby[ja] = ruby
+            if key in self._translations:
+                self._translations[key] = translation
+                return
+            grams = shingles(ja)
+            band_keys = self._band_keys_for(lang, minhash(grams))
+            self._translations[key] = translation
+            self._ruby_refs[ja] = self._ruby_refs.get(ja, 0) + 1
+            self._shingles[key] = grams
+            self._band_keys[key] = band_keys
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, []).append(key)
+            self._order.append(key)
+            while len(self._order) > self.capacity:
+                self._evict(self._order.popleft())
+
+    def _evict(self, key):
+        for band_key in self._band_keys.pop(key):
+            bucket = self._buckets[band_key]
+            bucket.remove(key)
+            if not bucket:
+                del self._buckets[band_key]
+        del self._translations[key]
+        del self._shingles[key]
+        ja = key[1]
+        self._ruby_refs[ja] -= 1
+        if not self._ruby_refs[ja]:
+            del self._ruby_refs[ja]
+            self._ruby.pop(ja, None)
+
+    def hit_rate(self):
+        """命中率（完全命中 + 采用了参考译文的相似命中）/ 查找次数"""
+        lookups = self.stats["lookups"]
+        return (self.stats["exact"] + self.stats["fuzzy"]) / lookups if lookups else 0.0